@@ -1,251 +1,318 @@
-import tempfile
 import streamlit as st
 import os
-import json
 import pandas as pd
-import google.generativeai as genai
-from io import BytesIO
-import openpyxl
-from dotenv import load_dotenv
-import re
-from datetime import datetime
 from streamlit_pdf_viewer import pdf_viewer
+from extractor import (
+    BATCH_MAX_WORKERS, describe_extraction_error, export_batch_tables, extract_document,
+    process_documents_batch, save_batch_to_excel, save_to_excel
+)
+from extraction_cache import get_default_cache
+from gemini_scheduler import get_default_scheduler
+from telemetry import METRICS, configure_logging, serve_metrics
+from page_sections import page_count, split_pages
+from columnar_export import EXPORT_FORMATS
+from normalize import format_numeric_values
+from field_schema import EDIT_NORMALIZERS, FLATTEN_NORMALIZERS, SCHEMA
+from job_queue import DONE, FAILED, get_default_queue
+from duplicate_index import DuplicateMatch
+
+# Pages handed to the PDF viewer at a time; the rest are paged in on demand
+PDF_VIEWER_PAGE_WINDOW = int(os.getenv('PDF_VIEWER_PAGE_WINDOW', '5'))
+
+# Seconds between status checks while a background extraction job runs
+JOB_POLL_SECONDS = float(os.getenv('JOB_POLL_SECONDS', '1'))
+
+# Port for a Prometheus /metrics endpoint next to the app (disabled when unset)
+METRICS_PORT = os.getenv('METRICS_PORT')
+
+def get_job_queue():
+    """Background extraction queue shared by every session"""
+    return get_default_queue(extract_document, describe_error=describe_extraction_error)
+
+def render_section_fields(section, record):
+    """Render one text input per schema field of a section and store the edits"""
+    for field in SCHEMA.fields_by_section[section.name]:
+        new_value = st.text_input(
+            field.label,
+            value=FLATTEN_NORMALIZERS[field.type](SCHEMA.get_value(record, field)),
+            key=f"{section.widget_prefix}{field.name}"
+        )
+        SCHEMA.set_value(record, field, EDIT_NORMALIZERS.get(field.type, str)(new_value))
+
+@st.fragment
+def render_pdf_viewer():
+    """PDF preview that sends the viewer one window of pages at a time.
+
+    Runs as a fragment, so paging through a long scan only reruns the viewer,
+    and each window is split out once per document and kept in the session.
+    """
+    total_pages = st.session_state.pdf_page_count
+    first_page = 1
+    if total_pages > PDF_VIEWER_PAGE_WINDOW:
+        first_page = st.selectbox(
+            "Pages",
+            range(1, total_pages + 1, PDF_VIEWER_PAGE_WINDOW),
+            format_func=lambda page: f"{page}–{min(page + PDF_VIEWER_PAGE_WINDOW - 1, total_pages)} of {total_pages}",
+            key=f"viewer_window_{st.session_state.current_file_id}"
+        )
+    window = st.session_state.viewer_windows.get(first_page)
+    if window is None:
+        last_page = min(first_page + PDF_VIEWER_PAGE_WINDOW - 1, total_pages)
+        window = split_pages(st.session_state.pdf_bytes, range(first_page - 1, last_page))
+        st.session_state.viewer_windows[first_page] = window
+    pdf_viewer(
+        window, width=700, height=1100,
+        key=f"pdf_viewer_{st.session_state.current_file_id}_{first_page}"
+    )
 
-
-
-load_dotenv()
-GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
-
-# Configure Gemini AI
-genai.configure(api_key=GEMINI_API_KEY)
-
-# Date and Value Formatting Functions
-def standardize_date(date_str):
-    """Convert different date formats to DD/MM/YYYY."""
-    if not date_str or not isinstance(date_str, str):
-        return ""
-    for fmt in ("%d/%m/%Y", "%d-%m-%Y", "%Y-%m-%d", "%d %b %Y", "%d %B %Y"):
-        try:
-            return datetime.strptime(date_str.strip(), fmt).strftime("%d/%m/%Y")
-        except ValueError:
-            continue
-    return date_str  # Return original if parsing fails
-
-def format_numeric_value(value):
-    """Format numeric values with commas as thousand separators."""
-    if not value:
-        return ""
-    value = re.sub(r'[^0-9.,]', '', str(value))  # Remove non-numeric characters
-    try:
-        numeric_value = float(value.replace(',', ''))
-        return f"{numeric_value:,.0f}"  # Format with commas
-    except ValueError:
-        return value  # Return original if conversion fails
-
-def save_to_excel(data):
-    """Save extracted data to Excel format with formatted dates and values"""
-    wb = openpyxl.Workbook()
-
-    # Sheet 1: Policy & Vehicle Details
-    ws1 = wb.active
-    ws1.title = "Policy & Vehicle Details"
-    policy_fields = [
-        "Policy_Number", "Full_Name", "NIC_or_Reg_No", "Postal_Address", "Mobile", 
-        "Landline", "Email", "preferred_language", "Financial_Interest", 
-        "Accident_free_or_other_damages", "Claims_in_Last_3_Years", "Registered_Owner", 
-        "Business_Occupation"
-    ]
-    for col_idx, field in enumerate(policy_fields, start=1):
-        ws1.cell(row=1, column=col_idx, value=field)
-    for col_idx, field in enumerate(policy_fields, start=1):
-        ws1.cell(row=2, column=col_idx, value=str(data.get(field, "")))
-
-    # Sheet 2: Vehicle Information
-    ws2 = wb.create_sheet("Vehicle Information")
-    vehicle_fields = [
-        "Make_Model", "Registration_No", "Chassis_No", "Year_of_Make", 
-        "First_Registration_Date", "Country_of_Make", "Fuel_Type", "Cubic_Capacity", 
-        "Seating_Capacity", "Vehicle_Registered_As", "Usage_of_Vehicle", 
-        "Market_Value", "Extra_Fittings_Value", "Total_Value_Insured"
-    ]
-    for col_idx, field in enumerate(vehicle_fields, start=1):
-        ws2.cell(row=1, column=col_idx, value=field)
-    for col_idx, field in enumerate(vehicle_fields, start=1):
-        value = data.get(field, "")
-        if field in ["First_Registration_Date", "Year_of_Make"]:
-            value = standardize_date(value)
-        elif field in ["Market_Value", "Extra_Fittings_Value", "Total_Value_Insured"]:
-            value = format_numeric_value(value)
-        ws2.cell(row=2, column=col_idx, value=str(value))
-
-    # Sheet 3: Insurance Coverage
-    ws3 = wb.create_sheet("Insurance Coverage")
-    coverage_headers = ["Cover Type", "Amount", "Additional Info"]
-    for col_idx, header in enumerate(coverage_headers, start=1):
-        ws3.cell(row=1, column=col_idx, value=header)
-    covers = data.get("covers", [])
-    if isinstance(covers, pd.DataFrame):
-        covers = covers.to_dict('records')
-    for row_idx, cover in enumerate(covers, start=2):
-        ws3.cell(row=row_idx, column=1, value=str(cover.get("Cover Type", "")))
-        ws3.cell(row=row_idx, column=2, value=format_numeric_value(cover.get("Amount", "")))
-        ws3.cell(row=row_idx, column=3, value=str(cover.get("Additional Info", "")))
-
-    # Sheet 4: Policy & Proposer Details
-    ws4 = wb.create_sheet("Policy & Proposer")
-    policy_fields = ["Period_From", "Period_To", "Proposer_Date", "Proposer_Signature"]
-    for col_idx, field in enumerate(policy_fields, start=1):
-        ws4.cell(row=1, column=col_idx, value=field)
-    ws4.cell(row=2, column=1, value=standardize_date(data.get("Period_From", "")))
-    ws4.cell(row=2, column=2, value=standardize_date(data.get("Period_To", "")))
-    ws4.cell(row=2, column=3, value=standardize_date(data.get("proposer_details", {}).get("date", "")))
-    ws4.cell(row=2, column=4, value=str(data.get("proposer_details", {}).get("proposer_signature", "")))
-
-    buffer = BytesIO()
-    wb.save(buffer)
-    buffer.seek(0)
-    return buffer
-
-def flatten_json(extracted_data):
-    """Flatten the extracted JSON and format dates and values"""
-    flat_data = {}
-    policy = extracted_data.get("Policy & Vehicle Details", {})
-    flat_data["Policy_Number"] = policy.get("Policy_Number", "")
-    flat_data["Full_Name"] = policy.get("Full_Name", "")
-    flat_data["NIC_or_Reg_No"] = policy.get("NIC_or_Reg_No", "")
-    flat_data["Postal_Address"] = policy.get("Postal_Address", "")
-    flat_data["Mobile"] = policy.get("Mobile", "")
-    flat_data["Landline"] = policy.get("Landline", "")
-    flat_data["Email"] = policy.get("Email", "")
-    flat_data["preferred_language"] = policy.get("preferred_language", "")
-    flat_data["Financial_Interest"] = policy.get("Financial_Interest", "")
-    flat_data["Accident_free_or_other_damages"] = policy.get("Accident_free_or_other_damages", "")
-    flat_data["Claims_in_Last_3_Years"] = policy.get("Claims_in_Last_3_Years", "")
-    flat_data["Registered_Owner"] = policy.get("Registered_Owner", "")
-    flat_data["Business_Occupation"] = policy.get("Business_Occupation", "")
-
-    vehicle = extracted_data.get("Vehicle Information", {})
-    flat_data["Make_Model"] = vehicle.get("Make_Model", "")
-    flat_data["Registration_No"] = vehicle.get("Registration_No", "")
-    flat_data["Chassis_No"] = vehicle.get("Chassis_No", "")
-    flat_data["Year_of_Make"] = standardize_date(vehicle.get("Year_of_Make", ""))
-    flat_data["First_Registration_Date"] = standardize_date(vehicle.get("First_Registration_Date", ""))
-    flat_data["Country_of_Make"] = vehicle.get("Country_of_Make", "")
-    flat_data["Fuel_Type"] = vehicle.get("Fuel_Type", "")
-    flat_data["Cubic_Capacity"] = vehicle.get("Cubic_Capacity", "")
-    flat_data["Seating_Capacity"] = vehicle.get("Seating_Capacity", "")
-    flat_data["Vehicle_Registered_As"] = vehicle.get("Vehicle_Registered_As", "")
-    flat_data["Usage_of_Vehicle"] = vehicle.get("Usage_of_Vehicle", "")
-    flat_data["Market_Value"] = format_numeric_value(vehicle.get("Market_Value", ""))
-    flat_data["Extra_Fittings_Value"] = format_numeric_value(vehicle.get("Extra_Fittings_Value", ""))
-    flat_data["Total_Value_Insured"] = format_numeric_value(vehicle.get("Total_Value_Insured", ""))
-
-    covers = extracted_data.get("Insurance Coverage", [])
-    flat_data["covers"] = [
-        {
-            "Cover Type": cover.get("Cover Type", ""),
-            "Amount": format_numeric_value(cover.get("Amount", "")),
-            "Additional Info": cover.get("Additional Info", "")
-        } for cover in covers
-    ]
-
-    policy_period = extracted_data.get("Policy & Proposer", {})
-    flat_data["Period_From"] = standardize_date(policy_period.get("Period_From", ""))
-    flat_data["Period_To"] = standardize_date(policy_period.get("Period_To", ""))
-    proposer_signature = policy_period.get("Proposer_Signature", "")
-    if proposer_signature and proposer_signature.strip():
-        if any(c.isalpha() for c in proposer_signature):
-            flat_data["proposer_details"] = {
-                "date": standardize_date(policy_period.get("Proposer_Date", "")),
-                "proposer_signature": proposer_signature
-            }
-        else:
-            flat_data["proposer_details"] = {
-                "date": standardize_date(policy_period.get("Proposer_Date", "")),
-                "proposer_signature": "available"
+def attach_job_result(job):
+    """Move a finished job's record into the session and open the review"""
+    st.session_state.job_id = None
+    st.query_params.pop("job", None)
+    if job["status"] == FAILED or not job["result"]:
+        st.session_state.job_error = job["error"] or "Failed to extract data from document"
+        return
+    st.session_state.extracted_data = job["result"]
+    st.session_state.edited_data = job["result"].copy()
+    st.session_state.step = 1
+    st.session_state.coverage_frame = None
+    st.session_state.show_process_button = False
+    st.session_state.time_to_first_field = job["time_to_first_field"]
+    st.session_state.duplicate_matches = [DuplicateMatch(**match) for match in job["duplicates"]]
+    st.toast("✅ Document processed successfully!")
+
+def render_duplicate_warning(matches):
+    """Point out earlier documents this one appears to resubmit"""
+    lines = []
+    for match in matches[:3]:
+        when = pd.Timestamp(match.created, unit="s").strftime("%Y-%m-%d %H:%M")
+        reasons = []
+        if match.matched_fields:
+            reasons.append("same " + ", ".join(field.replace("_", " ") for field in match.matched_fields))
+        if match.near_duplicate:
+            reasons.append("pages look the same")
+        reason = "; ".join(reasons)
+        policy = match.record.get("Policy_Number") or "no policy number"
+        lines.append(f"- {policy}, extracted {when}: {reason}")
+    st.warning("⚠️ This document resembles earlier extractions:\n" + "\n".join(lines))
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def render_job_status():
+    """Poll the background job; its streamed step-1 fields preview as they arrive"""
+    job = get_job_queue().get(st.session_state.job_id)
+    if job is None:
+        st.session_state.job_id = None
+        st.query_params.pop("job", None)
+        st.rerun()
+    if job["status"] in (DONE, FAILED):
+        attach_job_result(job)
+        st.rerun()
+
+    st.info("⏳ Queued..." if job["started"] is None else "⏳ Analyzing document...")
+    streamed = {
+        path[1]: value for path, value in job["partial"]
+        if len(path) == 2 and path[0] == SCHEMA.sections[0].name
+    }
+    with st.expander(SCHEMA.sections[0].title, expanded=True):
+        for field in SCHEMA.fields_by_section[SCHEMA.sections[0].name]:
+            st.markdown(f"**{field.label}:** {streamed.get(field.name, '…')}")
+
+def go_to_step(step):
+    """Button callback; the fragment rerun it triggers renders the new step"""
+    st.session_state.step = step
+    # The coverage editor is rebuilt from the saved rows when its step is re-entered
+    st.session_state.coverage_frame = None
+
+@st.fragment
+def render_review():
+    """The four review steps; widget edits rerun only this fragment"""
+    # Drawn here, not in main(): Next / Previous rerun only this fragment
+    if st.session_state.step == 1 and st.session_state.time_to_first_field is not None:
+        st.caption(f"⏱️ First field after {st.session_state.time_to_first_field:.2f}s")
+    if st.session_state.step == 1 and st.session_state.duplicate_matches:
+        render_duplicate_warning(st.session_state.duplicate_matches)
+
+    if st.session_state.step in [3, 4]:
+        st.markdown(
+            """
+            <style>
+            .custom-margin {
+                margin-top: 500px; 
             }
+            </style>
+            """,
+            unsafe_allow_html=True
+        )
+        st.markdown('<div class="custom-margin">', unsafe_allow_html=True)
+        st.subheader("🔍 Extracted Data")
     else:
-        flat_data["proposer_details"] = {
-            "date": standardize_date(policy_period.get("Proposer_Date", "")),
-            "proposer_signature": ""
-        }
-    return flat_data
-
-def process_document(pdf_bytes):
-    """Process PDF document using Gemini AI"""
-    
-    try:
-        import hashlib
-        import time
+        st.subheader("🔍 Extracted Data")
 
-        pdf_hash = hashlib.md5(pdf_bytes).hexdigest()
-        cache_key = f"gemini_cache_{pdf_hash}"
+    section = SCHEMA.sections[st.session_state.step - 1]
+    if not section.is_list:
+        with st.expander(section.title, expanded=True):
+            render_section_fields(section, st.session_state.edited_data)
+    else:
+        with st.expander(section.title, expanded=True):
+            if 'covers' in st.session_state.edited_data:
+                # Build the editor's input frame once per visit to the step: feeding
+                # it back the edited rows on every rerun would re-apply the edits
+                if st.session_state.coverage_frame is None:
+                    if isinstance(st.session_state.edited_data['covers'], list):
+                        coverage_df = pd.DataFrame(st.session_state.edited_data['covers'])
+                    else:
+                        coverage_df = pd.DataFrame(columns=SCHEMA.cover_columns)
+                    # Format amounts in the coverage dataframe
+                    if 'Amount' in coverage_df.columns:
+                        coverage_df['Amount'] = format_numeric_values(coverage_df['Amount'])
+                    st.session_state.coverage_frame = coverage_df
+                edited_coverage = st.data_editor(
+                    st.session_state.coverage_frame,
+                    column_config={
+                        "Cover Type": "Cover Type",
+                        "Amount": st.column_config.TextColumn("Amount", help="Enter amount (e.g., 4500000)"),
+                        "Additional Info": "Additional Info"
+                    },
+                    num_rows="dynamic",
+                    use_container_width=True,
+                    key="coverage_editor"
+                )
+                st.session_state.edited_data['covers'] = edited_coverage.to_dict('records')
 
-        if cache_key in st.session_state:
-            return st.session_state[cache_key]
+    if st.session_state.step in [3, 4]:
+        st.markdown('</div>', unsafe_allow_html=True)
 
+    col_left, col_space, col_right = st.columns([3, 8, 2])
+    with col_left:
+        if st.session_state.step > 1:
+            st.button("⬅️ Previous", key="prev_btn", on_click=go_to_step, args=(st.session_state.step - 1,))
+    with col_right:
+        if st.session_state.step < 4:
+            st.button("➡️ Next", key="next_btn", on_click=go_to_step, args=(st.session_state.step + 1,))
 
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_file:
-            temp_file.write(pdf_bytes)
-            temp_file_path = temp_file.name
+    if st.session_state.step == 4:
+        st.markdown("---")
+        button_placeholder = st.empty()
 
-        uploaded_file = genai.upload_file(
-            path=temp_file_path,
-            mime_type="application/pdf"
-        )
-        model = genai.GenerativeModel('gemini-1.5-flash')
-
-        prompt = (
-            "Extract all insurance form fields from the document. Return structured JSON data with: "
-            "1. 'Policy & Vehicle Details' including Policy_Number, Full_Name, NIC_or_Reg_No, Postal_Address, Mobile, Landline, Email, preferred_language, Financial_Interest, Accident_free_or_other_damages, Claims_in_Last_3_Years, Registered_Owner, Business_Occupation; "
-            "2. 'Vehicle Information' including Make_Model, Registration_No, Chassis_No, Year_of_Make, First_Registration_Date, Country_of_Make, Fuel_Type, Cubic_Capacity, Seating_Capacity, Vehicle_Registered_As, Usage_of_Vehicle, Market_Value, Extra_Fittings_Value, Total_Value_Insured; "
-            "3. 'Insurance Coverage' as a list of objects representing all additional coverage options that are ticked, marked, or selected in the form. Each object should include: 'Cover Type' (the name/description of the coverage), 'Amount' (any specified value or limit, if provided, otherwise empty string), and 'Additional Info' (any extra details related to that coverage). Include all ticked/marked coverages from sections like 'Additional Covers'; "
-            "4. 'Policy & Proposer' including Period_From, Period_To, Proposer_Date, Proposer_Signature. "
-            "For Proposer_Signature, if it contains a readable name, extract the name; if a signature is present but not readable as a name, return 'available'; if no signature is present, return an empty string. "
-            "Format all date fields (Year_of_Make, First_Registration_Date, Period_From, Period_To, Proposer_Date) in 'DD/MM/YYYY' format (e.g., '01/01/2018'). "
-            "Format all amount fields (Market_Value, Extra_Fittings_Value, Total_Value_Insured, and 'Amount' in Insurance Coverage) with commas as thousand separators (e.g., '4,500,000'). "
-            "Ensure the output is valid JSON. If a field is not present or cannot be determined, use an empty string ('') or an empty list ([]) as appropriate."
+        if st.session_state.show_export_button:
+            if button_placeholder.button("💾 Export to Excel", key="export_btn"):
+                with st.spinner("Generating Excel file..."):
+                    try:
+                        export_data = st.session_state.edited_data.copy()
+                        if 'covers' not in export_data or export_data['covers'] is None:
+                            export_data['covers'] = []
+                        elif isinstance(export_data['covers'], pd.DataFrame):
+                            export_data['covers'] = export_data['covers'].to_dict('records')
+                        excel_file = save_to_excel(export_data)
+                        st.session_state.excel_file = excel_file.getvalue()
+                        st.session_state.show_export_button = False
+                        st.rerun(scope="fragment")
+                    except Exception as e:
+                        st.error(f"Export error: {str(e)}")
+        else:
+            button_placeholder.download_button(
+                label="⬇️ Download Excel File",
+                data=st.session_state.excel_file,
+                file_name="insurance_details.xlsx",
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                key="download_btn"
+            )
+
+def render_metrics_dashboard():
+    """Latency percentiles, cache and retry counters and spend for this server process"""
+    st.markdown("---")
+    st.subheader("📈 Metrics")
+
+    def seconds(value):
+        return "–" if value is None else f"{value:.2f}s"
+
+    documents = METRICS.percentiles("extraction_document_seconds")
+    cache_stats = get_default_cache().stats()
+    spend = METRICS.daily_spend(days=7)
+    cols = st.columns(5)
+    cols[0].metric("Documents", METRICS.count("extraction_document_seconds"))
+    cols[1].metric("p50 latency", seconds(documents[0.5]))
+    cols[2].metric("p95 latency", seconds(documents[0.95]))
+    cols[3].metric("Cache hit ratio", f"{cache_stats['hit_ratio']:.0%}")
+    cols[4].metric("Spend today", f"${spend[-1][1]:.4f}")
+
+    stages = []
+    for stage in METRICS.label_values("extraction_stage_seconds", "stage"):
+        stage_percentiles = METRICS.percentiles("extraction_stage_seconds", stage=stage)
+        stages.append({
+            "Stage": stage,
+            "Calls": METRICS.count("extraction_stage_seconds", stage=stage),
+            "p50 (s)": stage_percentiles[0.5],
+            "p95 (s)": stage_percentiles[0.95],
+        })
+    if stages:
+        st.dataframe(pd.DataFrame(stages), hide_index=True, use_container_width=True)
+    st.caption(f"Gemini retries after rate limits: {get_default_scheduler().retries}")
+    st.bar_chart(pd.DataFrame(spend, columns=["Date", "Spend (USD)"]).set_index("Date"))
+
+def render_batch_mode():
+    """Multi-file upload that extracts documents concurrently into one workbook"""
+    if 'batch_results' not in st.session_state:
+        st.session_state.batch_results = None
+    if 'batch_excel_file' not in st.session_state:
+        st.session_state.batch_excel_file = None
+
+    st.markdown("---")
+    st.subheader("📚 Batch Processing")
+    uploaded_files = st.file_uploader(
+        "Upload PDF Insurance Documents", type=["pdf"], accept_multiple_files=True
+    )
+    max_workers = st.number_input(
+        "Concurrent extractions", min_value=1, max_value=32, value=BATCH_MAX_WORKERS
+    )
+
+    if uploaded_files and st.button("🚀 Process Batch"):
+        documents = [(f.name, f.getvalue()) for f in uploaded_files]
+        documents = [(name, data) for name, data in documents if data]
+        overall = st.progress(0.0, text=f"0 / {len(documents)} documents processed")
+        rows = [st.empty() for _ in documents]
+        for row, (name, _) in zip(rows, documents):
+            row.markdown(f"⏳ {name}")
+        completed = [0]
+
+        def on_progress(idx, file_name, status):
+            completed[0] += 1
+            icon = "✅" if status == "done" else "❌"
+            rows[idx].markdown(f"{icon} {file_name}")
+            overall.progress(
+                completed[0] / len(documents),
+                text=f"{completed[0]} / {len(documents)} documents processed"
+            )
+
+        results = process_documents_batch(documents, max_workers=max_workers, on_progress=on_progress)
+        st.session_state.batch_results = results
+        succeeded = [(name, record) for name, record, error in results if record]
+        st.session_state.batch_excel_file = (
+            save_batch_to_excel(succeeded).getvalue() if succeeded else None
         )
-        
-        for attempt in range(2):
-            try:
-                response = model.generate_content([prompt, uploaded_file])
-                break
-            except Exception as e:
-                if "429" in str(e):
-                    time.sleep(60)
-                else:
-                    raise e
-
-        os.unlink(temp_file_path)
-
-        if response and hasattr(response, 'text') and response.text:
-            response_text = response.text.strip()
-            if response_text.startswith("```json") and response_text.endswith("```"):
-                json_str = response_text[7:-3].strip()
-            else:
-                json_str = response_text
-
-            def fix_trailing_commas(json_str):
-                import re
-                json_str = re.sub(r',\s*([}\]])', r'\1', json_str)
-                return json_str
-
-            json_str = fix_trailing_commas(json_str)
-            try:
-                final_data = flatten_json(extracted_data)
-                st.session_state[cache_key] = final_data
-                return final_data
 
-            except json.JSONDecodeError as e:
-                st.error(f"JSON parsing error: {str(e)} - Raw response: {response_text}")
-                return None
-        else:
-            st.error("No valid response text received from Gemini.")
-            return None
-    except Exception as e:
-        st.error(f"Processing error: {str(e)}")
-        return None
+    if st.session_state.batch_results:
+        failed = [(name, error) for name, _, error in st.session_state.batch_results if error]
+        st.success(f"✅ {len(st.session_state.batch_results) - len(failed)} document(s) extracted")
+        for name, error in failed:
+            st.error(f"❌ {name}: {error}")
+        if st.session_state.batch_excel_file:
+            st.download_button(
+                label="⬇️ Download Consolidated Excel File",
+                data=st.session_state.batch_excel_file,
+                file_name="insurance_batch_details.xlsx",
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                key="batch_download_btn"
+            )
+            export_format = st.selectbox("Table export format", EXPORT_FORMATS, key="batch_export_format")
+            succeeded = [(name, record) for name, record, _ in st.session_state.batch_results if record]
+            st.download_button(
+                label=f"⬇️ Download Policy & Coverage Tables ({export_format.upper()})",
+                data=export_batch_tables(succeeded, export_format),
+                file_name=f"insurance_batch_tables_{export_format}.zip",
+                mime="application/zip",
+                key="batch_tables_download_btn"
+            )
 
 def main():
     st.set_page_config(layout="wide", page_title="Insurance Document Processor")
@@ -257,6 +324,23 @@ def main():
         unsafe_allow_html=True
     )
 
+    configure_logging()
+    if METRICS_PORT:
+        serve_metrics(int(METRICS_PORT))
+
+    mode = st.sidebar.radio("Mode", ["Single document", "Batch", "Metrics"])
+    cache_stats = get_default_cache().stats()
+    st.sidebar.caption(
+        f"Extraction cache: {cache_stats['entries']} documents, "
+        f"{cache_stats['hits']} hits / {cache_stats['misses']} misses"
+    )
+    if mode == "Metrics":
+        render_metrics_dashboard()
+        return
+    if mode == "Batch":
+        render_batch_mode()
+        return
+
     # Initialize session state
     if 'extracted_data' not in st.session_state:
         st.session_state.extracted_data = None
@@ -270,10 +354,25 @@ def main():
         st.session_state.excel_file = None  
     if 'show_export_button' not in st.session_state:
         st.session_state.show_export_button = True  
-    if 'current_file_name' not in st.session_state:
-        st.session_state.current_file_name = None  
+    if 'current_file_id' not in st.session_state:
+        st.session_state.current_file_id = None  
     if 'pdf_bytes' not in st.session_state:
         st.session_state.pdf_bytes = None
+    if 'pdf_page_count' not in st.session_state:
+        st.session_state.pdf_page_count = 0
+    if 'viewer_windows' not in st.session_state:
+        st.session_state.viewer_windows = {}
+    if 'coverage_frame' not in st.session_state:
+        st.session_state.coverage_frame = None
+    if 'job_id' not in st.session_state:
+        # Re-attach to a job still running from before a reconnect
+        st.session_state.job_id = st.query_params.get("job")
+    if 'job_error' not in st.session_state:
+        st.session_state.job_error = None
+    if 'time_to_first_field' not in st.session_state:
+        st.session_state.time_to_first_field = None
+    if 'duplicate_matches' not in st.session_state:
+        st.session_state.duplicate_matches = []
 
     # Column widths
     col1, col2 = st.columns([2, 2], gap="large")
@@ -284,200 +383,62 @@ def main():
         uploaded_file = st.file_uploader("Upload PDF Insurance Document", type=["pdf"])
         
         if uploaded_file:
-            new_file_name = uploaded_file.name
-            if st.session_state.current_file_name != new_file_name:
+            new_file_id = uploaded_file.file_id
+            if st.session_state.current_file_id != new_file_id:
                 st.session_state.extracted_data = None
                 st.session_state.edited_data = None
                 st.session_state.step = 0
                 st.session_state.show_process_button = True
                 st.session_state.excel_file = None
                 st.session_state.show_export_button = True
-                st.session_state.current_file_name = new_file_name
+                st.session_state.current_file_id = new_file_id
                 st.session_state.pdf_bytes = None
+                st.session_state.pdf_page_count = 0
+                st.session_state.viewer_windows = {}
+                st.session_state.coverage_frame = None
+                st.session_state.job_id = None
+                st.session_state.job_error = None
+                st.session_state.duplicate_matches = []
+                st.query_params.pop("job", None)
                 st.rerun()
 
             try:
-                pdf_bytes = uploaded_file.getvalue()
-                st.session_state.pdf_bytes = pdf_bytes
+                # Read the upload once per document rather than on every rerun
+                if st.session_state.pdf_bytes is None:
+                    st.session_state.pdf_bytes = uploaded_file.getvalue()
 
                 # Validate PDF size
-                if len(pdf_bytes) == 0:
+                if len(st.session_state.pdf_bytes) == 0:
                     st.error("Uploaded PDF is empty.")
                     return
 
-                # Display PDF using streamlit-pdf-viewer
-                pdf_viewer(pdf_bytes, width=700, height=1100)
+                if not st.session_state.pdf_page_count:
+                    st.session_state.pdf_page_count = page_count(st.session_state.pdf_bytes)
 
-                uploaded_file.seek(0)
+                # Display PDF using streamlit-pdf-viewer
+                render_pdf_viewer()
             except Exception as e:
                 st.error(f"PDF rendering error: {str(e)}")
 
     with col2:
         st.markdown("---")
         if uploaded_file and st.session_state.show_process_button:
-            if st.button("🚀 Process Document"):
-                with st.spinner("Analyzing document..."):
-                    try:
-                        pdf_bytes = st.session_state.pdf_bytes
-                        result = process_document(pdf_bytes)
-                        if result:
-                            st.session_state.extracted_data = result
-                            st.session_state.edited_data = result.copy()
-                            st.session_state.step = 1
-                            st.session_state.show_process_button = False
-                            st.success("✅ Document processed successfully!")
-                        else:
-                            st.error("❌ Failed to extract data from document")
-                    except Exception as e:
-                        st.error(f"❌ Processing error: {str(e)}")
+            if st.session_state.job_id is None and st.button("🚀 Process Document"):
+                # Extraction runs on the shared worker pool; this session only polls it
+                st.session_state.job_error = None
+                st.session_state.time_to_first_field = None
+                st.session_state.job_id = get_job_queue().submit(
+                    st.session_state.pdf_bytes, uploaded_file.name
+                )
+                st.query_params["job"] = st.session_state.job_id
+
+        if st.session_state.job_id:
+            render_job_status()
+        elif st.session_state.job_error:
+            st.error(f"❌ {st.session_state.job_error}")
 
         if st.session_state.edited_data:  
-            if st.session_state.step in [3, 4]:
-                st.markdown(
-                    """
-                    <style>
-                    .custom-margin {
-                        margin-top: 500px; 
-                    }
-                    </style>
-                    """,
-                    unsafe_allow_html=True
-                )
-                st.markdown('<div class="custom-margin">', unsafe_allow_html=True)
-                st.subheader("🔍 Extracted Data")
-            else:
-                st.subheader("🔍 Extracted Data")
-
-            if st.session_state.step == 1:
-                with st.expander("📋 Policy & Vehicle Details", expanded=True):
-                    fields = ['Policy_Number', 'Full_Name', 'NIC_or_Reg_No', 'Postal_Address',
-                             'Mobile', 'Landline', 'Email', 'preferred_language',
-                             'Financial_Interest', 'Accident_free_or_other_damages',
-                             'Claims_in_Last_3_Years', 'Registered_Owner', 'Business_Occupation']
-                    for field in fields:
-                        new_value = st.text_input(
-                            field.replace('_', ' ').title(),
-                            value=st.session_state.edited_data.get(field, ''),
-                            key=f"policy_{field}"
-                        )
-                        st.session_state.edited_data[field] = new_value
-
-            elif st.session_state.step == 2:
-                with st.expander("🚗 Vehicle Information", expanded=True):
-                    vehicle_fields = ['Make_Model', 'Registration_No', 'Chassis_No',
-                                     'Year_of_Make', 'First_Registration_Date',
-                                     'Country_of_Make', 'Fuel_Type', 'Cubic_Capacity',
-                                     'Seating_Capacity', 'Vehicle_Registered_As',
-                                     'Usage_of_Vehicle', 'Market_Value', 'Extra_Fittings_Value',
-                                     'Total_Value_Insured']
-                    for field in vehicle_fields:
-                        value = st.session_state.edited_data.get(field, '')
-                        if field in ['Year_of_Make', 'First_Registration_Date']:
-                            value = standardize_date(value)
-                        elif field in ['Market_Value', 'Extra_Fittings_Value', 'Total_Value_Insured']:
-                            value = format_numeric_value(value)
-                        new_value = st.text_input(
-                            field.replace('_', ' ').title(),
-                            value=value,
-                            key=f"vehicle_{field}"
-                        )
-                        st.session_state.edited_data[field] = new_value
-
-            elif st.session_state.step == 3:
-                with st.expander("🛡️ Insurance Coverage", expanded=True):
-                    if 'covers' in st.session_state.edited_data:
-                        if isinstance(st.session_state.edited_data['covers'], list):
-                            coverage_df = pd.DataFrame(st.session_state.edited_data['covers'])
-                        else:
-                            coverage_df = pd.DataFrame(columns=["Cover Type", "Amount", "Additional Info"])
-                        # Format amounts in the coverage dataframe
-                        if 'Amount' in coverage_df.columns:
-                            coverage_df['Amount'] = coverage_df['Amount'].apply(format_numeric_value)
-                        edited_coverage = st.data_editor(
-                            coverage_df,
-                            column_config={
-                                "Cover Type": "Cover Type",
-                                "Amount": st.column_config.TextColumn("Amount", help="Enter amount (e.g., 4500000)"),
-                                "Additional Info": "Additional Info"
-                            },
-                            num_rows="dynamic",
-                            use_container_width=True,
-                            key="coverage_editor"
-                        )
-                        st.session_state.edited_data['covers'] = edited_coverage.to_dict('records')
-
-            elif st.session_state.step == 4:
-                with st.expander("📅 Policy & Proposer Details", expanded=True):
-                    new_period_from = st.text_input(
-                        "Period From",
-                        value=standardize_date(st.session_state.edited_data.get('Period_From', '')),
-                        key="period_from"
-                    )
-                    new_period_to = st.text_input(
-                        "Period To",
-                        value=standardize_date(st.session_state.edited_data.get('Period_To', '')),
-                        key="period_to"
-                    )
-                    new_proposer_date = st.text_input(
-                        "Proposer Date",
-                        value=standardize_date(st.session_state.edited_data.get('proposer_details', {}).get('date', '')),
-                        key="proposer_date"
-                    )
-                    new_proposer_signature = st.text_input(
-                        "Proposer Signature",
-                        value=st.session_state.edited_data.get('proposer_details', {}).get('proposer_signature', ''),
-                        key="proposer_signature"
-                    )
-                    st.session_state.edited_data['Period_From'] = new_period_from
-                    st.session_state.edited_data['Period_To'] = new_period_to
-                    st.session_state.edited_data['proposer_details'] = {
-                        "date": new_proposer_date,
-                        "proposer_signature": new_proposer_signature if any(c.isalpha() for c in new_proposer_signature) else "available" if new_proposer_signature else ""
-                    }
-
-            if st.session_state.step in [3, 4]:
-                st.markdown('</div>', unsafe_allow_html=True)
-
-            col_left, col_space, col_right = st.columns([3, 8, 2])
-            with col_left:
-                if st.session_state.step > 1:
-                    if st.button("⬅️ Previous", key="prev_btn"):
-                        st.session_state.step -= 1
-                        st.rerun()
-            with col_right:
-                if st.session_state.step < 4:
-                    if st.button("➡️ Next", key="next_btn"):
-                        st.session_state.step += 1
-                        st.rerun()
-
-            if st.session_state.step == 4:
-                st.markdown("---")
-                button_placeholder = st.empty()
-
-                if st.session_state.show_export_button:
-                    if button_placeholder.button("💾 Export to Excel", key="export_btn"):
-                        with st.spinner("Generating Excel file..."):
-                            try:
-                                export_data = st.session_state.edited_data.copy()
-                                if 'covers' not in export_data or export_data['covers'] is None:
-                                    export_data['covers'] = []
-                                elif isinstance(export_data['covers'], pd.DataFrame):
-                                    export_data['covers'] = export_data['covers'].to_dict('records')
-                                excel_file = save_to_excel(export_data)
-                                st.session_state.excel_file = excel_file.getvalue()
-                                st.session_state.show_export_button = False
-                                st.rerun()
-                            except Exception as e:
-                                st.error(f"Export error: {str(e)}")
-                else:
-                    button_placeholder.download_button(
-                        label="⬇️ Download Excel File",
-                        data=st.session_state.excel_file,
-                        file_name="insurance_details.xlsx",
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                        key="download_btn"
-                    )
+            render_review()
 
 if __name__ == "__main__":
     main()
-
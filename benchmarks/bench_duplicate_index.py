@@ -0,0 +1,128 @@
+"""Benchmark duplicate-index lookups as the index grows.
+
+Fills a fresh DuplicateIndex with synthetic three-page documents (ink grids
+sharing a printed template, with random filled-in rows, and random
+identifiers; no PDFs rendered), then times check() for rescans of indexed
+documents (grids with a few flipped cells), for key field matches, and for
+unseen documents. Reports insert rate, lookup percentiles, recall of the
+rescans and unseen documents wrongly matched. Run from the repo root:
+
+    python benchmarks/bench_duplicate_index.py --documents 1000000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from duplicate_index import _GRID, DuplicateIndex  # noqa: E402
+
+# Share of grid rows holding the printed template, and of cells inked
+TEMPLATE_ROWS = 0.6
+INK_RATIO = 0.05
+
+
+def synthetic_templates(rng, pages=3):
+    """Per page: (grid rows that hold the template, the template's ink)."""
+    templates = []
+    for _ in range(pages):
+        rows = np.array([rng.random() < TEMPLATE_ROWS for _ in range(_GRID)])
+        templates.append((rows, random_grid(rng)))
+    return templates
+
+
+def random_grid(rng):
+    generator = np.random.default_rng(rng.getrandbits(32))
+    return generator.random((_GRID, _GRID)) < INK_RATIO
+
+
+def synthetic_page(template, rng):
+    rows, ink = template
+    grid = random_grid(rng)
+    grid[rows] = ink[rows]
+    return np.packbits(grid).tobytes()
+
+
+def synthetic_document(idx, rng, templates):
+    record = {
+        "Policy_Number": f"VM-{idx:08d}",
+        "Chassis_No": f"NZE{rng.getrandbits(40):012X}",
+        "Registration_No": f"WP CAB-{idx % 10000:04d}",
+        "NIC_or_Reg_No": f"{rng.randrange(10**8, 10**9)}V",
+    }
+    return f"document-{idx}".encode(), record, [synthetic_page(template, rng) for template in templates]
+
+
+def flip_bits(page_hash, bits, rng):
+    cells = np.unpackbits(np.frombuffer(page_hash, dtype=np.uint8))
+    cells[rng.sample(range(len(cells)), bits)] ^= 1
+    return np.packbits(cells).tobytes()
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return {f"p{q}": samples[min(len(samples) - 1, len(samples) * q // 100)] * 1000 for q in (50, 95, 99)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--documents", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--flipped-bits", type=int,
+                        help="Cells changed per page to mimic a rescan (default: the index's max distance)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    index = DuplicateIndex(os.path.join(tempfile.mkdtemp(prefix="bench_duplicates_"), "duplicates.sqlite3"))
+    if args.flipped_bits is None:
+        args.flipped_bits = index.max_distance
+
+    templates = synthetic_templates(rng)
+    documents = []
+    started = time.perf_counter()
+    for idx in range(args.documents):
+        pdf_bytes, record, hashes = synthetic_document(idx, rng, templates)
+        index.add(pdf_bytes, record, hashes)
+        if len(documents) < args.queries:
+            documents.append((record, hashes))
+        elif rng.random() < args.queries / (idx + 1):
+            documents[rng.randrange(args.queries)] = (record, hashes)
+    insert_seconds = time.perf_counter() - started
+    print(f"Indexed {args.documents} documents in {insert_seconds:.1f}s "
+          f"({args.documents / insert_seconds:,.0f} docs/s)")
+
+    timings = {"rescan": [], "key_match": [], "unseen": []}
+    found = 0
+    false_matches = 0
+    for record, hashes in documents:
+        rescan = [flip_bits(page_hash, args.flipped_bits, rng) for page_hash in hashes]
+        started = time.perf_counter()
+        matches = index.check(b"query", None, rescan)
+        timings["rescan"].append(time.perf_counter() - started)
+        found += any(match.record == record and match.near_duplicate for match in matches)
+
+        started = time.perf_counter()
+        index.check(b"query", {"Chassis_No": record["Chassis_No"]}, [None])
+        timings["key_match"].append(time.perf_counter() - started)
+
+        unseen = [synthetic_page(template, rng) for template in templates]
+        started = time.perf_counter()
+        matches = index.check(b"query", None, unseen)
+        timings["unseen"].append(time.perf_counter() - started)
+        false_matches += any(match.near_duplicate for match in matches)
+
+    for kind, samples in timings.items():
+        values = percentiles(samples)
+        print(f"  {kind:<10} " + "   ".join(f"{name} {value:7.3f} ms" for name, value in values.items()))
+    print(f"Rescan recall {found / len(documents):.1%} ({args.flipped_bits} flipped cells per page), "
+          f"unseen documents matched {false_matches / len(documents):.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Benchmark the streaming bulk Excel exporter.
+
+Generates synthetic flatten_json records on the fly and streams them through
+save_batch_to_excel, reporting rows/sec and peak RSS. Run from the repo root:
+
+    python benchmarks/bench_excel_export.py --rows 10000
+"""
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from extractor import save_batch_to_excel  # noqa: E402
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def synthetic_records(count, covers_per_policy):
+    for idx in range(count):
+        yield f"proposal_{idx:06d}.pdf", {
+            "Policy_Number": f"VM-{idx:08d}",
+            "Full_Name": "John Perera",
+            "NIC_or_Reg_No": "901234567V",
+            "Postal_Address": "12 Main Street, Colombo 03",
+            "Mobile": "0771234567",
+            "Landline": "0112345678",
+            "Email": "john@example.com",
+            "preferred_language": "English",
+            "Financial_Interest": "ABC Leasing PLC",
+            "Accident_free_or_other_damages": "Accident free",
+            "Claims_in_Last_3_Years": "None",
+            "Registered_Owner": "John Perera",
+            "Business_Occupation": "Engineer",
+            "Make_Model": "Toyota Axio",
+            "Registration_No": f"CAB-{idx % 10000:04d}",
+            "Chassis_No": f"NZE141-{idx:07d}",
+            "Year_of_Make": "2018",
+            "First_Registration_Date": "2018-03-15",
+            "Country_of_Make": "Japan",
+            "Fuel_Type": "Petrol",
+            "Cubic_Capacity": "1500",
+            "Seating_Capacity": "5",
+            "Vehicle_Registered_As": "Motor Car",
+            "Usage_of_Vehicle": "Private",
+            "Market_Value": "4500000",
+            "Extra_Fittings_Value": "150000",
+            "Total_Value_Insured": "4650000",
+            "covers": [
+                {"Cover Type": f"Cover {n}", "Amount": "500000", "Additional Info": ""}
+                for n in range(covers_per_policy)
+            ],
+            "Period_From": "01/01/2024",
+            "Period_To": "31 Dec 2024",
+            "proposer_details": {"date": "15-12-2023", "proposer_signature": "available"},
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000, help="number of policies to export")
+    parser.add_argument("--covers", type=int, default=3, help="coverage rows per policy")
+    parser.add_argument("--output", help="workbook path (default: a temporary file)")
+    args = parser.parse_args()
+
+    output = args.output or os.path.join(tempfile.gettempdir(), "bench_excel_export.xlsx")
+    baseline = peak_rss_mb()
+    started = time.perf_counter()
+    save_batch_to_excel(synthetic_records(args.rows, args.covers), output)
+    elapsed = time.perf_counter() - started
+
+    print(f"policies:      {args.rows}")
+    print(f"elapsed:       {elapsed:.2f} s")
+    print(f"rows/sec:      {args.rows / elapsed:,.0f} policies/s")
+    print(f"peak RSS:      {peak_rss_mb():.1f} MiB (baseline {baseline:.1f} MiB)")
+    print(f"workbook size: {os.path.getsize(output) / (1024 * 1024):.1f} MiB -> {output}")
+    if not args.output:
+        os.unlink(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Microbenchmark: per-cell vs column-wise date and amount normalization.
+
+Builds a column of raw values with the repetition typical of batch exports,
+checks the vectorized functions give identical output to the per-cell ones
+and reports the speedup. Run from the repo root:
+
+    python benchmarks/bench_normalize.py --values 100000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd  # noqa: E402
+
+import normalize  # noqa: E402
+
+# The per-cell functions as they run without memoization
+_uncached_date = normalize._standardize_date_str.__wrapped__
+_uncached_number = normalize._format_numeric_str.__wrapped__
+
+
+def per_cell_date(value):
+    if not value or not isinstance(value, str):
+        return ""
+    return _uncached_date(value)
+
+
+def per_cell_number(value):
+    if not value:
+        return ""
+    return _uncached_number(str(value))
+
+
+def raw_dates(count, distinct, rng):
+    pool = []
+    for _ in range(distinct):
+        day, month, year = rng.randint(1, 28), rng.randint(1, 12), rng.randint(1990, 2030)
+        pool.append(rng.choice([
+            f"{day:02d}/{month:02d}/{year}",
+            f"{day:02d}-{month:02d}-{year}",
+            f"{year}-{month:02d}-{day:02d}",
+            f"{day} {['Jan', 'Mar', 'Jul', 'Dec'][month % 4]} {year}",
+            f"{day} {['January', 'March', 'July', 'December'][month % 4]} {year}",
+        ]))
+    pool += ["", "N/A", "2018"]
+    return pd.Series([rng.choice(pool) for _ in range(count)], dtype=object)
+
+
+def raw_amounts(count, distinct, rng):
+    pool = [rng.choice(["{:,}", "Rs. {}", "{}.00", "{}"]).format(rng.randint(1, 50) * 50000) for _ in range(distinct)]
+    pool += ["", "N/A", "1.2.3"]
+    return pd.Series([rng.choice(pool) for _ in range(count)], dtype=object)
+
+
+def bench(label, per_cell, vectorized, values):
+    started = time.perf_counter()
+    expected = [per_cell(value) for value in values]
+    scalar_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    actual = vectorized(values)
+    vector_time = time.perf_counter() - started
+
+    if list(actual) != expected:
+        raise SystemExit(f"{label}: vectorized output differs from per-cell output")
+    print(f"{label:<8} per-cell {scalar_time * 1000:8.1f} ms   column-wise {vector_time * 1000:8.1f} ms   "
+          f"speedup {scalar_time / vector_time:5.1f}x   (identical output)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--values", type=int, default=100000, help="values per column")
+    parser.add_argument("--distinct", type=int, default=2000, help="distinct raw values per column")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{args.values:,} values, {args.distinct:,} distinct")
+    bench("dates", per_cell_date, normalize.standardize_dates, raw_dates(args.values, args.distinct, rng))
+    bench("amounts", per_cell_number, normalize.format_numeric_values, raw_amounts(args.values, args.distinct, rng))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""Offline end-to-end benchmark and accuracy regression check.
+
+Replays a corpus of PDFs against the recorded-response Gemini stub
+(genai_stub.py), so no network or API key is needed. Each document goes
+through extract_document (the work behind a Process Document job,
+including flatten_json), and then save_to_excel and one consolidated
+save_batch_to_excel. The run reports docs/sec, document and per-stage latency
+percentiles, retries after injected 429s, peak RSS and field-level accuracy
+against the golden records. It exits non-zero below --min-accuracy.
+
+Without --corpus a synthetic corpus of mixed text-layer and scanned forms
+is generated first. Run from the repo root:
+
+    python benchmarks/bench_offline.py --documents 40 --workers 4 --rate-limit 0.05
+    python benchmarks/bench_offline.py --corpus path/to/corpus --json baseline.json
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import genai_stub  # noqa: E402
+
+
+def peak_rss_mb():
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    return usage / (1024 * 1024) if sys.platform == "darwin" else usage / 1024
+
+
+def compare(record, golden):
+    """[(field, matched)] for every scalar field and cover row of the golden record."""
+    from field_schema import SCHEMA
+
+    results = [
+        (field.name, str(SCHEMA.get_value(record, field)) == str(SCHEMA.get_value(golden, field)))
+        for field in SCHEMA.fields
+    ]
+    actual_covers = sorted(tuple(cover.get(key, "") for key in SCHEMA.cover_columns) for cover in record.get("covers", []))
+    expected_covers = sorted(tuple(cover.get(key, "") for key in SCHEMA.cover_columns) for cover in golden.get("covers", []))
+    matched = 0
+    for cover in expected_covers:
+        if cover in actual_covers:
+            actual_covers.remove(cover)
+            matched += 1
+    results += [("covers", True)] * matched + [("covers", False)] * (len(expected_covers) - matched + len(actual_covers))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", help="Directory of <name>.pdf / .response.txt / .golden.json")
+    parser.add_argument("--documents", type=int, default=40, help="Synthetic corpus size")
+    parser.add_argument("--scanned-ratio", type=float, default=0.5)
+    parser.add_argument("--blank-ratio", type=float, default=0.15, help="Share of fields left blank on the forms")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.8, help="Mean seconds per model call")
+    parser.add_argument("--jitter", type=float, default=0.3)
+    parser.add_argument("--chunks", type=int, default=8, help="Streamed chunks per response")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="Share of calls answered with a 429")
+    parser.add_argument("--retry-after", type=float, help="Retry hint (seconds) sent with injected 429s")
+    parser.add_argument("--rpm", type=float, default=6000, help="Scheduler requests-per-minute budget")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--min-accuracy", type=float, default=0.0)
+    parser.add_argument("--json", help="Also write the summary to this file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_offline_")
+    corpus_dir = args.corpus or genai_stub.make_synthetic_corpus(
+        os.path.join(workdir, "corpus"), args.documents, args.scanned_ratio, args.seed, args.blank_ratio
+    )
+    corpus = genai_stub.load_corpus(corpus_dir)
+    backend = genai_stub.StubBackend(
+        genai_stub.RecordedResponses(corpus), latency=args.latency, jitter=args.jitter, chunks=args.chunks,
+        rate_limit_rate=args.rate_limit, retry_after=args.retry_after, seed=args.seed
+    )
+    genai_stub.install(backend)
+
+    # A fresh cache and duplicate index per run, so every document is really extracted
+    os.environ["EXTRACTION_CACHE_PATH"] = os.path.join(workdir, "extractions.sqlite3")
+    os.environ["DUPLICATE_INDEX_PATH"] = os.path.join(workdir, "duplicates.sqlite3")
+    os.environ["GEMINI_RPM"] = str(args.rpm)
+    import extractor  # noqa: E402
+    from gemini_scheduler import get_default_scheduler  # noqa: E402
+    from telemetry import METRICS  # noqa: E402
+
+    documents = [(name, pdf_bytes) for name, pdf_bytes, _, _ in corpus]
+    started = time.perf_counter()
+    results = extractor.process_documents_batch(documents, max_workers=args.workers)
+    extract_seconds = time.perf_counter() - started
+
+    succeeded = [(name, record) for name, record, error in results if record]
+    for name, record in succeeded:
+        extractor.save_to_excel(record)
+    extractor.save_batch_to_excel(succeeded, os.path.join(workdir, "batch.xlsx"))
+    total_seconds = time.perf_counter() - started
+
+    goldens = {name: golden for name, _, _, golden in corpus}
+    matches = []
+    for name, record in succeeded:
+        matches += compare(record, goldens[name])
+    per_field = {}
+    for field, matched in matches:
+        hits, total = per_field.get(field, (0, 0))
+        per_field[field] = (hits + matched, total + 1)
+    accuracy = sum(matched for _, matched in matches) / len(matches) if matches else 0.0
+
+    document_percentiles = METRICS.percentiles("extraction_document_seconds", quantiles=(0.5, 0.95, 0.99))
+    summary = {
+        "documents": len(documents),
+        "failed": [(name, error) for name, _, error in results if error],
+        "workers": args.workers,
+        "docs_per_second": len(succeeded) / extract_seconds if extract_seconds else 0.0,
+        "extract_seconds": extract_seconds,
+        "total_seconds": total_seconds,
+        "document_latency": {f"p{int(q * 100)}": value for q, value in document_percentiles.items()},
+        "stages": {
+            stage: {f"p{int(q * 100)}": value for q, value in METRICS.percentiles("extraction_stage_seconds", stage=stage).items()}
+            for stage in METRICS.label_values("extraction_stage_seconds", "stage")
+        },
+        "model_calls": backend.calls,
+        "injected_429s": backend.rate_limited,
+        "retries": get_default_scheduler().retries,
+        "peak_rss_mb": peak_rss_mb(),
+        "accuracy": accuracy,
+        "field_accuracy": {field: hits / total for field, (hits, total) in per_field.items()},
+    }
+
+    print(f"{len(succeeded)}/{len(documents)} documents, {args.workers} workers, "
+          f"{summary['docs_per_second']:.2f} docs/s (extract {extract_seconds:.1f}s, end to end {total_seconds:.1f}s)")
+    print("Document latency: " + ", ".join(
+        f"{name} {value:.2f}s" for name, value in summary["document_latency"].items() if value is not None))
+    for stage, values in summary["stages"].items():
+        print(f"  {stage:<20} p50 {values['p50'] * 1000:8.1f} ms   p95 {values['p95'] * 1000:8.1f} ms")
+    print(f"Model calls {backend.calls}, injected 429s {backend.rate_limited}, retries {summary['retries']}")
+    print(f"Peak RSS {summary['peak_rss_mb']:.0f} MB")
+    print(f"Field accuracy {accuracy:.1%}")
+    for field, value in sorted(summary["field_accuracy"].items(), key=lambda item: item[1])[:5]:
+        if value < 1:
+            print(f"  {field:<32} {value:.1%}")
+    for name, error in summary["failed"]:
+        print(f"  FAILED {name}: {error}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+    sys.exit(1 if accuracy < args.min_accuracy or summary["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Rerun-latency budget for the single-document review flow.
+
+Drives app.py headlessly with Streamlit's AppTest: uploads a synthetic
+multi-page PDF, seeds an extracted record (no Gemini call) and times the
+interactions a reviewer repeats most: typing into a step-1 field, moving
+between steps, editing on the last step and paging the PDF viewer. Exits
+non-zero when any interaction's p95 exceeds the budget. AppTest always
+reruns the whole script, so the numbers are an upper bound on what a
+fragment-scoped rerun costs in the browser. Run from the repo root:
+
+    python benchmarks/bench_rerun_latency.py --pages 40 --budget-ms 250
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pymupdf  # noqa: E402
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+from field_schema import SCHEMA  # noqa: E402
+
+
+def synthetic_pdf(pages):
+    doc = pymupdf.open()
+    for number in range(1, pages + 1):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Motor Insurance Proposal - page {number}", fontsize=14)
+        for line, field in enumerate(SCHEMA.fields):
+            page.insert_text((72, 110 + 18 * line), f"{field.label}: value {number}", fontsize=10)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def extracted_record():
+    record = {}
+    for field in SCHEMA.fields:
+        SCHEMA.set_value(record, field, f"{field.label} value")
+    record["covers"] = [
+        {"Cover Type": f"Cover {idx}", "Amount": f"{idx * 1000}", "Additional Info": ""}
+        for idx in range(10)
+    ]
+    return record
+
+
+def timed(action, samples):
+    durations = []
+    for idx in range(samples):
+        start = time.perf_counter()
+        action(idx)
+        durations.append((time.perf_counter() - start) * 1000)
+    return durations
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--samples", type=int, default=20)
+    parser.add_argument("--budget-ms", type=float, default=250.0)
+    args = parser.parse_args()
+
+    at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=60)
+    at.run()
+    at.file_uploader[0].set_value(("proposal.pdf", synthetic_pdf(args.pages), "application/pdf")).run()
+    record = extracted_record()
+    at.session_state["extracted_data"] = record
+    at.session_state["edited_data"] = dict(record)
+    at.session_state["step"] = 1
+    at.session_state["show_process_button"] = False
+    at.run()
+    if at.exception:
+        raise SystemExit(f"App raised: {at.exception[0].message}")
+
+    first_field = SCHEMA.fields_by_section[SCHEMA.sections[0].name][0]
+    field_key = f"{SCHEMA.sections[0].widget_prefix}{first_field.name}"
+
+    def type_into_field(idx):
+        at.text_input(key=field_key).input(f"edit {idx}").run()
+
+    def step_forward_and_back(idx):
+        at.button(key="next_btn").click().run()
+        at.button(key="prev_btn").click().run()
+
+    last = SCHEMA.sections[-1]
+    last_key = f"{last.widget_prefix}{SCHEMA.fields_by_section[last.name][0].name}"
+
+    def type_on_last_step(idx):
+        at.text_input(key=last_key).input(f"edit {idx}").run()
+
+    windows = at.selectbox[0].options if at.selectbox else []
+
+    def page_viewer(idx):
+        at.selectbox[0].set_value(int(windows[idx % len(windows)].split("–")[0])).run()
+
+    scenarios = [("edit step-1 field", type_into_field), ("next + previous", step_forward_and_back)]
+    results = []
+    for name, action in scenarios:
+        results.append((name, timed(action, args.samples)))
+    for _ in range(len(SCHEMA.sections) - 1):
+        at.button(key="next_btn").click().run()
+    results.append(("edit last-step field", timed(type_on_last_step, args.samples)))
+    if windows:
+        results.append(("page PDF viewer", timed(page_viewer, args.samples)))
+
+    over_budget = False
+    print(f"{args.pages}-page document, {args.samples} samples, budget p95 <= {args.budget_ms:.0f} ms")
+    for name, durations in results:
+        p95 = percentile(durations, 0.95)
+        over_budget |= p95 > args.budget_ms
+        print(
+            f"  {name:<22} p50 {statistics.median(durations):7.1f} ms   "
+            f"p95 {p95:7.1f} ms   {'OK' if p95 <= args.budget_ms else 'OVER BUDGET'}"
+        )
+    if at.exception:
+        raise SystemExit(f"App raised: {at.exception[0].message}")
+    sys.exit(1 if over_budget else 0)
+
+
+if __name__ == "__main__":
+    main()
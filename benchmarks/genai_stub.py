@@ -0,0 +1,293 @@
+"""Offline stand-in for the parts of google.generativeai the extractor uses.
+
+install() puts a stub module in sys.modules before the extractor is
+imported. The stub replays recorded model output for each document of a
+corpus, streamed in chunks with configurable latency, and can inject 429
+rate-limit errors. Uploaded files are matched to their corpus document by
+content hash, and page subsets (section-split requests) by per-page
+fingerprints. Requests for only some sections get just those sections of
+the recording.
+
+A corpus directory holds, per document, `<name>.pdf`, `<name>.response.txt`
+(the raw model text for a full extraction) and `<name>.golden.json` (the
+expected flatten_json record). make_synthetic_corpus writes one.
+"""
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+import types
+from datetime import datetime, timedelta
+
+import pymupdf
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from field_schema import COVERAGE_SECTION, SCHEMA  # noqa: E402
+from normalize import format_numeric_value  # noqa: E402
+from response_decoder import decode_response  # noqa: E402
+
+
+class ResourceExhausted(Exception):
+    code = 429
+
+
+def _page_fingerprints(pdf_bytes):
+    prints = []
+    with pymupdf.open(stream=pdf_bytes, filetype="pdf") as doc:
+        for page in doc:
+            digest = hashlib.sha256(page.read_contents())
+            for image in page.get_images():
+                digest.update(doc.extract_image(image[0])["image"])
+            prints.append(digest.hexdigest())
+    return prints
+
+
+def load_corpus(directory):
+    """[(name, pdf_bytes, response_text, golden_record)] for every document in `directory`."""
+    corpus = []
+    for file_name in sorted(os.listdir(directory)):
+        if not file_name.endswith(".pdf"):
+            continue
+        name = file_name[:-4]
+        with open(os.path.join(directory, file_name), "rb") as f:
+            pdf_bytes = f.read()
+        with open(os.path.join(directory, f"{name}.response.txt"), encoding="utf-8") as f:
+            response_text = f.read()
+        with open(os.path.join(directory, f"{name}.golden.json"), encoding="utf-8") as f:
+            golden = json.load(f)
+        corpus.append((name, pdf_bytes, response_text, golden))
+    return corpus
+
+
+class RecordedResponses:
+    """Finds the recording for an uploaded document or a page subset of one."""
+
+    def __init__(self, corpus):
+        self._by_hash = {}
+        self._by_page = {}
+        for name, pdf_bytes, response_text, _ in corpus:
+            self._by_hash[hashlib.sha256(pdf_bytes).hexdigest()] = response_text
+            for fingerprint in _page_fingerprints(pdf_bytes):
+                self._by_page.setdefault(fingerprint, response_text)
+
+    def lookup(self, pdf_bytes):
+        response_text = self._by_hash.get(hashlib.sha256(pdf_bytes).hexdigest())
+        if response_text is None:
+            for fingerprint in _page_fingerprints(pdf_bytes):
+                response_text = self._by_page.get(fingerprint)
+                if response_text is not None:
+                    break
+        if response_text is None:
+            raise KeyError("Uploaded document is not in the recorded corpus")
+        return response_text
+
+
+class _Usage:
+    def __init__(self, prompt, output):
+        self.prompt_token_count = prompt
+        self.candidates_token_count = output
+        self.total_token_count = prompt + output
+
+
+class _Chunk:
+    def __init__(self, text, usage_metadata=None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+
+class _StreamedResponse:
+    def __init__(self, chunks, delays, usage, sleep):
+        self._chunks = chunks
+        self._delays = delays
+        self._sleep = sleep
+        self.usage_metadata = usage
+
+    def __iter__(self):
+        for idx, (text, delay) in enumerate(zip(self._chunks, self._delays)):
+            self._sleep(delay)
+            yield _Chunk(text, self.usage_metadata if idx == len(self._chunks) - 1 else None)
+
+
+class _File:
+    def __init__(self, name, content):
+        self.name = name
+        self.content = content
+        self.expiration_time = None
+
+
+class StubBackend:
+    """Latency, chunking and fault-injection settings shared by every stub call."""
+
+    def __init__(self, responses, latency=0.8, jitter=0.3, chunks=8, rate_limit_rate=0.0,
+                 retry_after=None, seed=0, sleep=time.sleep):
+        self.responses = responses
+        self.latency = latency
+        self.jitter = jitter
+        self.chunks = max(1, chunks)
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.sleep = sleep
+        self.calls = 0
+        self.rate_limited = 0
+        self.uploads = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def upload_file(self, path, mime_type=None, **kwargs):
+        content = path.read() if hasattr(path, "read") else open(path, "rb").read()
+        with self._lock:
+            self.uploads += 1
+            return _File(f"files/stub-{self.uploads}", content)
+
+    def generate_content(self, contents, generation_config=None, stream=False):
+        with self._lock:
+            self.calls += 1
+            limited = self._rng.random() < self.rate_limit_rate
+            self.rate_limited += limited
+            total = max(0.0, self._rng.gauss(self.latency, self.jitter))
+        if limited:
+            hint = f" Please retry in {self.retry_after}s." if self.retry_after is not None else ""
+            raise ResourceExhausted(f"429 Resource has been exhausted (e.g. check quota).{hint}")
+
+        prompt = next(part for part in contents if isinstance(part, str))
+        document = next(part for part in contents if isinstance(part, _File))
+        text = self.responses.lookup(document.content)
+        requested = list(((generation_config or {}).get("response_schema") or {}).get("properties", {}))
+        if requested and set(requested) != set(SCHEMA.section_fields):
+            data, _ = decode_response(text)
+            text = json.dumps({section: data.get(section) for section in requested if section in data})
+
+        with pymupdf.open(stream=document.content, filetype="pdf") as doc:
+            pages = doc.page_count
+        usage = _Usage(pages * 258 + len(prompt) // 4, len(text) // 4)
+        size = -(-len(text) // self.chunks)
+        chunks = [text[idx:idx + size] for idx in range(0, len(text), size)] or [""]
+        # Most of the latency comes before the first chunk, like a real model
+        delays = [total * 0.6] + [total * 0.4 / max(1, len(chunks) - 1)] * (len(chunks) - 1)
+        response = _StreamedResponse(chunks, delays, usage, self.sleep)
+        return response if stream else _Chunk("".join(chunks), usage)
+
+
+def install(backend):
+    """Register a google.generativeai stub backed by `backend`; returns the module."""
+    module = types.ModuleType("google.generativeai")
+    module.configure = lambda **kwargs: None
+    module.upload_file = backend.upload_file
+    module.GenerationConfig = lambda **kwargs: dict(kwargs)
+
+    class GenerativeModel:
+        def __init__(self, model_name, **kwargs):
+            self.model_name = model_name
+
+        def generate_content(self, contents, generation_config=None, stream=False, **kwargs):
+            return backend.generate_content(contents, generation_config, stream)
+
+    module.GenerativeModel = GenerativeModel
+    try:
+        import google
+    except ImportError:
+        google = sys.modules["google"] = types.ModuleType("google")
+        google.__path__ = []
+    google.generativeai = module
+    sys.modules["google.generativeai"] = module
+    return module
+
+
+# Synthetic corpus ---------------------------------------------------------
+
+_WORDS = ("Silva", "Perera", "Fernando", "Jayasuriya", "Bandara", "Wickrama", "Dias", "Gunawardena")
+_COVERS = ("Strike, Riot & Civil Commotion", "Flood", "Personal Accident", "Windscreen", "Terrorism")
+
+
+def _random_value(field, rng):
+    if field.type == "date":
+        day = datetime(2015, 1, 1) + timedelta(days=rng.randrange(3650))
+        return day.strftime("%d/%m/%Y")
+    if field.type == "amount":
+        return format_numeric_value(str(rng.randrange(10, 900) * 10_000))
+    if field.type == "signature":
+        return rng.choice(("available", rng.choice(_WORDS)))
+    return f"{rng.choice(_WORDS)} {rng.randrange(100, 9999)}"
+
+
+def _noisy_response(truth, rng):
+    """What a model might return for `truth`: reformatted dates, fences, stray commas."""
+    answer = json.loads(json.dumps(truth))
+    date_fields = {field.name for field in SCHEMA.fields_of_type("date")}
+    for fields in answer.values():
+        if isinstance(fields, dict) and rng.random() < 0.5:
+            for name in date_fields & {name for name, value in fields.items() if value}:
+                fields[name] = datetime.strptime(fields[name], "%d/%m/%Y").strftime("%Y-%m-%d")
+    text = json.dumps(answer, indent=2)
+    style = rng.random()
+    if style < 0.2:
+        text = f"```json\n{text}\n```"
+    elif style < 0.3:
+        text = text.replace('"\n  }', '",\n  }')
+    return text
+
+
+def _render_page(doc, lines, scanned):
+    page = doc.new_page()
+    y = 72
+    for line in lines:
+        page.insert_text((60, y), line, fontsize=10)
+        y += 16
+    if scanned:
+        pixmap = page.get_pixmap(dpi=100)
+        doc.delete_page(-1)
+        image_page = doc.new_page()
+        image_page.insert_image(image_page.rect, stream=pixmap.tobytes("png"))
+
+
+def make_synthetic_corpus(directory, count=40, scanned_ratio=0.5, seed=0, blank_ratio=0.15):
+    """Write `count` three-page proposal forms with recordings and goldens into `directory`.
+
+    About `blank_ratio` of the fields are left empty on the printed form, so
+    a blank label sits directly above the next label, as on real proposals.
+    """
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    for idx in range(count):
+        truth = {}
+        for section, fields in SCHEMA.section_fields.items():
+            if SCHEMA.section_by_name[section].is_list:
+                truth[section] = [
+                    {"Cover Type": cover, "Amount": format_numeric_value(str(rng.randrange(1, 50) * 50_000)),
+                     "Additional Info": ""}
+                    for cover in sorted(rng.sample(_COVERS, rng.randrange(0, 4)), key=_COVERS.index)
+                ]
+            else:
+                truth[section] = {
+                    field.name: "" if rng.random() < blank_ratio else _random_value(field, rng)
+                    for field in SCHEMA.fields_by_section[section]
+                }
+        truth_record = SCHEMA.flatten(truth)
+
+        scanned = rng.random() < scanned_ratio
+        doc = pymupdf.open()
+        for section in SCHEMA.sections:
+            if section.is_list:
+                continue
+            lines = [f"MOTOR INSURANCE PROPOSAL FORM - {section.name}", f"Reference {idx:05d}", ""]
+            lines += [f"{field.label}: {SCHEMA.get_value(truth_record, field)}" for field in SCHEMA.fields_by_section[section.name]]
+            if section.name == SCHEMA.sections[-1].name:
+                ticked = {cover["Cover Type"]: cover["Amount"] for cover in truth[COVERAGE_SECTION]}
+                lines += ["", "Additional Covers"] + [
+                    f"[x] {cover} {ticked[cover]}" if cover in ticked else f"[ ] {cover}"
+                    for cover in _COVERS
+                ]
+            _render_page(doc, lines, scanned)
+
+        name = f"proposal_{idx:05d}"
+        doc.save(os.path.join(directory, f"{name}.pdf"), garbage=3, deflate=True)
+        doc.close()
+        with open(os.path.join(directory, f"{name}.response.txt"), "w", encoding="utf-8") as f:
+            f.write(_noisy_response(truth, rng))
+        with open(os.path.join(directory, f"{name}.golden.json"), "w", encoding="utf-8") as f:
+            json.dump(truth_record, f, indent=2)
+    return directory
@@ -0,0 +1,66 @@
+from io import BytesIO
+
+import pandas as pd
+
+from field_schema import COLUMN_NORMALIZERS, SCHEMA
+
+POLICY_COLUMNS = ["Source_File"] + SCHEMA.field_names
+COVER_COLUMNS = ["Policy_Number", "Source_File"] + SCHEMA.cover_columns
+
+EXPORT_FORMATS = ("parquet", "csv", "jsonl")
+
+
+def records_to_frames(results):
+    """Normalize (file_name, record) pairs into a policies table and a covers child table.
+
+    Coverage rows are keyed by Policy_Number (plus Source_File, for policies
+    whose number could not be read) and keep their input order. Date and
+    amount columns are normalized column-wise.
+    """
+    policy_rows = []
+    cover_rows = []
+    for file_name, data in results:
+        row = {"Source_File": file_name}
+        for field in SCHEMA.fields:
+            row[field.name] = SCHEMA.get_value(data, field)
+        policy_rows.append(row)
+
+        for cover in data.get("covers") or []:
+            cover_row = {"Policy_Number": row["Policy_Number"], "Source_File": file_name}
+            for column in SCHEMA.cover_columns:
+                cover_row[column] = cover.get(column, "")
+            cover_rows.append(cover_row)
+
+    policies = pd.DataFrame(policy_rows, columns=POLICY_COLUMNS).fillna("").astype(str)
+    covers = pd.DataFrame(cover_rows, columns=COVER_COLUMNS).fillna("").astype(str)
+
+    for field in SCHEMA.fields:
+        normalize = COLUMN_NORMALIZERS.get(field.type)
+        if normalize:
+            policies[field.name] = normalize(policies[field.name])
+    for column, kind in SCHEMA.cover_types.items():
+        normalize = COLUMN_NORMALIZERS.get(kind)
+        if normalize:
+            covers[column] = normalize(covers[column])
+    return policies, covers
+
+
+def _write_frame(frame, fmt, target):
+    if fmt == "parquet":
+        frame.to_parquet(target, index=False)
+    elif fmt == "csv":
+        frame.to_csv(target, index=False)
+    elif fmt == "jsonl":
+        frame.to_json(target, orient="records", lines=True, force_ascii=False)
+    else:
+        raise ValueError(f"Unsupported export format: {fmt!r} (expected one of {', '.join(EXPORT_FORMATS)})")
+
+
+def export_frames(policies, covers, fmt):
+    """Serialize both tables in `fmt`, returning {file_name: bytes}."""
+    files = {}
+    for name, frame in (("policies", policies), ("covers", covers)):
+        buffer = BytesIO()
+        _write_frame(frame, fmt, buffer)
+        files[f"{name}.{fmt}"] = buffer.getvalue()
+    return files
@@ -0,0 +1,368 @@
+"""Index of extracted documents for spotting resubmissions.
+
+Exact copies are already served by the extraction cache. This index also
+finds rescans and lightly edited copies, by perceptual page hashes, and
+different files describing the same policy or vehicle, by their key
+identifiers (KEY_FIELDS).
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+
+import numpy as np
+import pymupdf
+
+# Fields that identify a proposal across resubmissions
+KEY_FIELDS = ("Policy_Number", "Chassis_No", "Registration_No", "NIC_or_Reg_No")
+
+# "flag" only reports matches; "reuse" fills the fields Gemini would be asked
+# for from a near-duplicate whose identifiers agree with the text layer
+DUPLICATE_ACTION = os.getenv("DUPLICATE_ACTION", "flag").lower()
+# Largest number of grid cells, inked on one page with no inked cell next to
+# them on the other, for two pages to count as the same page. Rescans
+# (resolution, JPEG quality, small shifts) stay within a cell or two; filled-in
+# copies of one template differ by 20 or more
+DUPLICATE_MAX_DISTANCE = int(os.getenv("DUPLICATE_MAX_DISTANCE", "8"))
+# Earlier documents compared cell by cell per lookup, taken in order of the
+# number of grid rows they share with the document being checked
+DUPLICATE_MAX_CANDIDATES = int(os.getenv("DUPLICATE_MAX_CANDIDATES", "20"))
+
+# Pages are rendered this many pixels across their shorter side and reduced to
+# a _GRID x _GRID grid of cells, each set when more than _CELL_INK_RATIO of
+# its pixels are darker than _INK_LEVEL
+_RENDER_SIZE = 512
+_GRID = 128
+_INK_LEVEL = 160
+_CELL_INK_RATIO = 0.1
+# Grid rows are indexed as bands after merging 2x2 cells, which a rescan
+# reproduces exactly on most rows, so an equality lookup per band finds it.
+# A band held by _BAND_ROW_LIMIT documents is printed template (labels,
+# headings), not evidence of a duplicate, and is dropped from the index
+_BAND_MERGE = 2
+_BAND_ROW_LIMIT = 256
+_POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+_NON_ALNUM = re.compile(r"[^0-9A-Z]")
+
+
+def normalize_key(value):
+    """Comparable form of an identifier: upper case, letters and digits only."""
+    return _NON_ALNUM.sub("", str(value or "").upper())
+
+
+def _packed(page_hashes):
+    return np.frombuffer(b"".join(page_hashes), dtype=np.uint8).reshape(len(page_hashes), -1)
+
+
+def _grids(page_hashes):
+    """Packed page hashes as a (pages, _GRID, _GRID) boolean array."""
+    return np.unpackbits(_packed(page_hashes), axis=1).reshape(len(page_hashes), _GRID, _GRID).astype(bool)
+
+
+def _dilate(page_hashes):
+    """Packed grids with each cell set when it or one of its eight neighbours is set."""
+    grids = _grids(page_hashes)
+    rows = grids.copy()
+    rows[:, 1:] |= grids[:, :-1]
+    rows[:, :-1] |= grids[:, 1:]
+    dilated = rows.copy()
+    dilated[:, :, 1:] |= rows[:, :, :-1]
+    dilated[:, :, :-1] |= rows[:, :, 1:]
+    return np.packbits(dilated.reshape(len(page_hashes), -1), axis=1)
+
+
+def _distances(pages, others):
+    """Shift-tolerant distance from each page to its counterpart in `others`.
+
+    `others` holds one or more documents laid out like `pages`. Counts the
+    cells inked on one page with no inked cell at or next to the same place
+    on the other, so ink edges that a rescan moves by one cell do not count,
+    while values written differently do.
+    """
+    repeats = len(others) // len(pages)
+    missing = _POPCOUNT[_packed(others) & np.tile(~_dilate(pages), (repeats, 1))]
+    extra = _POPCOUNT[np.tile(_packed(pages), (repeats, 1)) & ~_dilate(others)]
+    return missing.sum(axis=1, dtype=np.int64) + extra.sum(axis=1, dtype=np.int64)
+
+
+def _bands(page_hash):
+    """(row, signed 64-bit row value) for every inked row of the merged grid."""
+    merged = _grids([page_hash])[0].reshape(
+        _GRID // _BAND_MERGE, _BAND_MERGE, _GRID // _BAND_MERGE, _BAND_MERGE
+    ).any(axis=(1, 3))
+    rows = np.packbits(merged, axis=1).view("<i8").ravel()
+    return [(row, int(value)) for row, value in enumerate(rows.tolist()) if value]
+
+
+def page_hashes(pdf_bytes):
+    """Ink-grid hash (_GRID x _GRID bits, packed) of every page; None for blank pages.
+
+    Each page is rendered in grayscale and its ink moved to the top-left
+    corner, so a scan placed a little off on the glass lines up with the
+    original. The page is then split into grid cells, and each bit records
+    whether a cell holds ink. Cells are small enough that filled-in values
+    set different cells, and pages are compared with a one-cell tolerance
+    (see _distances) so that a rescan does not.
+    """
+    hashes = []
+    with pymupdf.open(stream=pdf_bytes, filetype="pdf") as doc:
+        for page in doc:
+            scale = _RENDER_SIZE / max(min(page.rect.width, page.rect.height), 1)
+            pixmap = page.get_pixmap(matrix=pymupdf.Matrix(scale, scale), colorspace=pymupdf.csGRAY, alpha=False)
+            gray = np.frombuffer(pixmap.samples, dtype=np.uint8).reshape(pixmap.height, pixmap.stride)[:, :pixmap.width]
+            ink = gray < _INK_LEVEL
+            rows = np.flatnonzero(ink.any(axis=1))
+            if not len(rows):
+                hashes.append(None)
+                continue
+            cols = np.flatnonzero(ink.any(axis=0))
+            anchored = np.zeros(ink.shape, dtype=np.float32)
+            part = ink[rows[0]:, cols[0]:]
+            anchored[:part.shape[0], :part.shape[1]] = part
+            row_starts = np.linspace(0, anchored.shape[0], _GRID + 1).astype(int)
+            col_starts = np.linspace(0, anchored.shape[1], _GRID + 1).astype(int)
+            cells = np.add.reduceat(np.add.reduceat(anchored, row_starts[:-1], axis=0), col_starts[:-1], axis=1)
+            cells /= np.outer(np.diff(row_starts), np.diff(col_starts))
+            hashes.append(np.packbits(cells > _CELL_INK_RATIO).tobytes())
+    return hashes
+
+
+@dataclass(frozen=True)
+class DuplicateMatch:
+    """An earlier document that resembles the one being checked."""
+    content_hash: str
+    created: float
+    record: dict
+    matched_fields: tuple = ()
+    conflicting_fields: tuple = ()
+    matched_pages: int = 0
+    pages: int = 0
+    distance: int = 0
+    keys_checked: bool = False
+
+    @property
+    def near_duplicate(self):
+        """Every non-blank page matches a page of the earlier document."""
+        return self.pages > 0 and self.matched_pages == self.pages
+
+    @property
+    def flagged(self):
+        """Worth reporting: an identifier agrees, or the pages match and the identifiers were checked and none disagrees."""
+        return bool(self.matched_fields) or (
+            self.near_duplicate and self.keys_checked and not self.conflicting_fields
+        )
+
+    @property
+    def reusable(self):
+        # Page similarity is never enough on its own to reuse a record: an
+        # identifier read from this document must agree as well
+        return self.near_duplicate and bool(self.matched_fields) and not self.conflicting_fields
+
+
+class DuplicateIndex:
+    """SQLite index of extracted documents by key fields and page hashes.
+
+    Lookups are indexed equality queries (key field values, and the grid
+    rows of each page hash); only the few documents sharing the most rows
+    are compared cell by cell, so lookups stay around a millisecond as the
+    index grows to millions of documents.
+    """
+
+    def __init__(self, path, max_distance=DUPLICATE_MAX_DISTANCE, max_candidates=DUPLICATE_MAX_CANDIDATES):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.max_distance = max_distance
+        self.max_candidates = max_candidates
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # Losing the last few entries on power loss only costs a missed flag
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "id INTEGER PRIMARY KEY, content_hash TEXT NOT NULL UNIQUE, pages INTEGER NOT NULL, "
+            "record TEXT NOT NULL, created REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS document_keys ("
+            "field TEXT NOT NULL, value TEXT NOT NULL, document_id INTEGER NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS document_keys_value ON document_keys (field, value);"
+            "CREATE TABLE IF NOT EXISTS document_pages ("
+            "document_id INTEGER NOT NULL, page INTEGER NOT NULL, hash BLOB NOT NULL, "
+            "PRIMARY KEY (document_id, page)) WITHOUT ROWID;"
+            "CREATE TABLE IF NOT EXISTS page_bands ("
+            "band INTEGER NOT NULL, value INTEGER NOT NULL, document_id INTEGER NOT NULL);"
+            # Covering index: a band lookup never touches the table itself
+            "CREATE INDEX IF NOT EXISTS page_bands_lookup ON page_bands (band, value, document_id);"
+            "CREATE TABLE IF NOT EXISTS template_bands ("
+            "band INTEGER NOT NULL, value INTEGER NOT NULL, PRIMARY KEY (band, value)) WITHOUT ROWID;"
+        )
+
+    def add(self, pdf_bytes, record, hashes=None):
+        """Index an extracted document; documents already indexed are left as they are."""
+        content_hash = hashlib.sha256(pdf_bytes).hexdigest()
+        hashes = page_hashes(pdf_bytes) if hashes is None else hashes
+        keys = [(field, normalize_key(record.get(field))) for field in KEY_FIELDS]
+        pages = [(page, page_hash) for page, page_hash in enumerate(hashes) if page_hash is not None]
+        bands = {band for _, page_hash in pages for band in _bands(page_hash)}
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO documents (content_hash, pages, record, created) VALUES (?, ?, ?, ?)",
+                    (content_hash, len(pages), json.dumps(record), time.time())
+                )
+                if cursor.rowcount:
+                    document_id = cursor.lastrowid
+                    self._conn.executemany(
+                        "INSERT INTO document_keys (field, value, document_id) VALUES (?, ?, ?)",
+                        [(field, value, document_id) for field, value in keys if value]
+                    )
+                    # Ink grids are mostly empty and compress about tenfold
+                    self._conn.executemany(
+                        "INSERT INTO document_pages (document_id, page, hash) VALUES (?, ?, ?)",
+                        [(document_id, page, zlib.compress(page_hash)) for page, page_hash in pages]
+                    )
+                    self._add_bands(bands, document_id)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _add_bands(self, bands, document_id):
+        self._conn.executemany(
+            "INSERT INTO page_bands (band, value, document_id) SELECT ?1, ?2, ?3 WHERE NOT EXISTS "
+            "(SELECT 1 FROM template_bands WHERE band = ?1 AND value = ?2)",
+            [(band, value, document_id) for band, value in bands]
+        )
+        # A band that has just filled up is template: it is recorded as such
+        # and its rows are dropped, which also bounds the size of the index
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO template_bands (band, value) SELECT ?1, ?2 WHERE ("
+            "SELECT COUNT(*) FROM (SELECT 1 FROM page_bands WHERE band = ?1 AND value = ?2 LIMIT ?3)) >= ?3",
+            [(band, value, _BAND_ROW_LIMIT) for band, value in bands]
+        )
+        self._conn.executemany(
+            "DELETE FROM page_bands WHERE band = ?1 AND value = ?2 AND EXISTS "
+            "(SELECT 1 FROM template_bands WHERE band = ?1 AND value = ?2)", list(bands)
+        )
+
+    def _similar_documents(self, hashes):
+        """IDs of the documents sharing the most grid rows with these pages, best first."""
+        shared = {}
+        bands = {band for page_hash in hashes if page_hash is not None for band in _bands(page_hash)}
+        with self._lock:
+            for band, value in bands:
+                for (document_id,) in self._conn.execute(
+                    "SELECT document_id FROM page_bands WHERE band = ? AND value = ?", (band, value)
+                ):
+                    shared[document_id] = shared.get(document_id, 0) + 1
+        return sorted(shared, key=shared.get, reverse=True)[:self.max_candidates]
+
+    def _key_matches(self, keys):
+        matches = {}
+        if not keys:
+            return matches
+        with self._lock:
+            for field, value in keys:
+                for (document_id,) in self._conn.execute(
+                    "SELECT document_id FROM document_keys WHERE field = ? AND value = ?", (field, value)
+                ):
+                    matches.setdefault(document_id, []).append(field)
+        return matches
+
+    def _page_distances(self, hashes, document_ids):
+        """{document_id: distance of each non-blank page to the same page of that document}.
+
+        Only documents with as many non-blank pages are compared.
+        """
+        queries = [page_hash for page_hash in hashes if page_hash is not None]
+        if not queries or not document_ids:
+            return {}
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT document_id, hash FROM document_pages "
+                f"WHERE document_id IN ({','.join('?' * len(document_ids))}) ORDER BY document_id, page",
+                list(document_ids)
+            ).fetchall()
+        pages = {}
+        for document_id, page_hash in rows:
+            pages.setdefault(document_id, []).append(zlib.decompress(page_hash))
+        aligned = [document_id for document_id, others in pages.items() if len(others) == len(queries)]
+        if not aligned:
+            return {}
+        distances = _distances(queries, [page for document_id in aligned for page in pages[document_id]])
+        return dict(zip(aligned, distances.reshape(len(aligned), len(queries)).tolist()))
+
+    def check(self, pdf_bytes, record=None, hashes=None):
+        """Earlier documents resembling this one, best match first.
+
+        A document matches when its pages are perceptually close to these
+        pages, or when it shares a key field value with `record` (a
+        flatten_json record, possibly partial). The document's own entry is
+        never returned.
+        """
+        content_hash = hashlib.sha256(pdf_bytes).hexdigest()
+        hashes = page_hashes(pdf_bytes) if hashes is None else hashes
+        record = record or {}
+        keys = [(field, normalize_key(record.get(field))) for field in KEY_FIELDS]
+        keys = [(field, value) for field, value in keys if value]
+        key_matches = self._key_matches(keys)
+        candidates = set(self._similar_documents(hashes)) | set(key_matches)
+        if not candidates:
+            return []
+        distances = self._page_distances(hashes, candidates)
+        pages = sum(page_hash is not None for page_hash in hashes)
+
+        matches = []
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, content_hash, record, created FROM documents "
+                f"WHERE id IN ({','.join('?' * len(candidates))})", list(candidates)
+            ).fetchall()
+        for document_id, other_hash, other_record, created in rows:
+            if other_hash == content_hash:
+                continue
+            other_record = json.loads(other_record)
+            conflicting = tuple(
+                field for field, value in keys
+                if normalize_key(other_record.get(field)) and normalize_key(other_record.get(field)) != value
+            )
+            close = [distance for distance in distances.get(document_id, []) if distance <= self.max_distance]
+            matches.append(DuplicateMatch(
+                content_hash=other_hash,
+                created=created,
+                record=other_record,
+                matched_fields=tuple(key_matches.get(document_id, ())),
+                conflicting_fields=conflicting,
+                matched_pages=len(close),
+                pages=pages,
+                distance=sum(close),
+                keys_checked=bool(keys),
+            ))
+        matches.sort(key=lambda m: (not m.reusable, not m.near_duplicate, -len(m.matched_fields), m.distance))
+        return matches
+
+    def stats(self):
+        with self._lock:
+            documents = self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+        return {"documents": documents}
+
+
+_default_index = None
+_default_index_lock = threading.Lock()
+
+
+def get_default_index():
+    """Process-wide index configured from DUPLICATE_INDEX_PATH."""
+    global _default_index
+    with _default_index_lock:
+        if _default_index is None:
+            _default_index = DuplicateIndex(
+                os.getenv("DUPLICATE_INDEX_PATH", os.path.join(".cache", "duplicates.sqlite3"))
+            )
+        return _default_index
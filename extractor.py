@@ -0,0 +1,514 @@
+"""Document extraction and export, independent of any user interface.
+
+The Streamlit app, the CLI and the HTTP service (service.py) all call into
+this module; it must not import Streamlit.
+"""
+import os
+import json
+import threading
+import google.generativeai as genai
+from io import BytesIO
+import openpyxl
+from dotenv import load_dotenv
+import re
+import time
+import logging
+from extraction_cache import get_default_cache, make_cache_key
+from gemini_scheduler import get_default_scheduler
+from text_layer import prefill_document
+from page_sections import locate_sections, page_count, split_pages
+from preprocess import PREPROCESS_SCANS, preprocess_pdf
+from duplicate_index import DUPLICATE_ACTION, get_default_index, page_hashes
+from stream_parser import StreamingFieldParser
+from response_decoder import build_response_schema, decode_response, validate_extraction
+from upload_registry import get_default_registry, is_stale_file_error
+from columnar_export import export_frames, records_to_frames
+from field_schema import COVERAGE_SECTION, SCHEMA
+from telemetry import METRICS, document_trace, emit, in_current_context, span
+
+
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+
+# Configure Gemini AI
+genai.configure(api_key=GEMINI_API_KEY)
+
+MODEL_NAME = 'gemini-1.5-flash'
+
+SECTION_FIELDS = SCHEMA.section_fields
+
+_signature_field = SCHEMA.fields_of_type("signature")[0].name
+PROMPT_RULES = (
+    f"For {_signature_field}, if it contains a readable name, extract the name; if a signature is present but not readable as a name, return 'available'; if no signature is present, return an empty string. "
+    f"Format all date fields ({', '.join(f.name for f in SCHEMA.fields_of_type('date'))}) in 'DD/MM/YYYY' format (e.g., '01/01/2018'). "
+    f"Format all amount fields ({', '.join(f.name for f in SCHEMA.fields_of_type('amount'))}, and 'Amount' in {COVERAGE_SECTION}) with commas as thousand separators (e.g., '4,500,000'). "
+    "Ensure the output is valid JSON. If a field is not present or cannot be determined, use an empty string ('') or an empty list ([]) as appropriate."
+)
+
+FULL_PROMPT_HEADER = "Extract all insurance form fields from the document. "
+PARTIAL_PROMPT_HEADER = "Extract only the following insurance form fields from the document. "
+
+def build_prompt(section_fields, header=FULL_PROMPT_HEADER):
+    """Build the extraction prompt for the given {section: [fields]} selection"""
+    parts = [
+        f"{idx}. " + SCHEMA.section_by_name[section].prompt.format(fields=", ".join(fields))
+        for idx, (section, fields) in enumerate(section_fields.items(), start=1)
+    ]
+    return header + "Return structured JSON data with: " + "; ".join(parts) + ". " + PROMPT_RULES
+
+EXTRACTION_PROMPT = build_prompt(SECTION_FIELDS)
+
+# Number of documents extracted in parallel in batch mode
+BATCH_MAX_WORKERS = int(os.getenv('BATCH_MAX_WORKERS', '4'))
+
+# Documents with at least this many pages are extracted section by section
+SECTION_SPLIT_MIN_PAGES = int(os.getenv('SECTION_SPLIT_MIN_PAGES', '3'))
+
+_model = None
+_model_lock = threading.Lock()
+
+def get_model():
+    """Process-wide Gemini client, created on first use and reused by every request"""
+    global _model
+    with _model_lock:
+        if _model is None:
+            _model = genai.GenerativeModel(MODEL_NAME)
+        return _model
+
+def warm_up():
+    """Create the model client and the shared cache, scheduler and upload registry up front"""
+    get_model()
+    get_default_cache()
+    get_default_scheduler()
+    get_default_registry()
+    get_default_index()
+
+def _collect_component_metrics():
+    cache = get_default_cache().stats()
+    registry = get_default_registry()
+    yield "extraction_cache_lookups_total", "counter", "Extraction cache lookups", {"result": "hit"}, cache["hits"]
+    yield "extraction_cache_lookups_total", "counter", "Extraction cache lookups", {"result": "miss"}, cache["misses"]
+    yield "extraction_cache_hit_ratio", "gauge", "Share of cache lookups that hit", {}, cache["hit_ratio"]
+    yield "extraction_cache_bytes", "gauge", "Size of the cached records", {}, cache["bytes"]
+    yield "gemini_retries_total", "counter", "Rate-limited Gemini calls that were retried", {}, get_default_scheduler().retries
+    yield "gemini_uploads_total", "counter", "PDF uploads, new or reused", {"result": "uploaded"}, registry.uploads
+    yield "gemini_uploads_total", "counter", "PDF uploads, new or reused", {"result": "reused"}, registry.reuses
+    yield "duplicate_index_documents", "gauge", "Documents in the duplicate index", {}, get_default_index().stats()["documents"]
+
+METRICS.add_collector(_collect_component_metrics)
+
+def save_to_excel(data):
+    """Save extracted data to Excel format with formatted dates and values"""
+    with span("excel_export"):
+        return _write_workbook(data)
+
+def _write_workbook(data):
+    wb = openpyxl.Workbook()
+    wb.remove(wb.active)
+
+    # One sheet per form section, in form order
+    for section in SCHEMA.sections:
+        ws = wb.create_sheet(section.name)
+        if section.is_list:
+            ws.append(SCHEMA.cover_columns)
+            for row in SCHEMA.export_cover_rows(data):
+                ws.append(row)
+        else:
+            ws.append(SCHEMA.section_fields[section.name])
+            ws.append(SCHEMA.export_row(data, section.name))
+
+    buffer = BytesIO()
+    wb.save(buffer)
+    buffer.seek(0)
+    return buffer
+
+def save_batch_to_excel(results, output=None):
+    """Stream many extracted records into one workbook, one row per document.
+
+    `results` may be any iterable (including a generator) of
+    (file_name, record) pairs; the workbook is opened in write-only mode so
+    rows are flushed as they are appended and memory stays flat however many
+    policies are exported. Writes to `output` (a path or binary file object)
+    when given, otherwise returns a BytesIO.
+    """
+    with span("excel_batch_export") as fields:
+        return _write_batch_workbook(results, output, fields)
+
+def _write_batch_workbook(results, output, fields):
+    wb = openpyxl.Workbook(write_only=True)
+
+    # Every sheet carries the source file, and Policy_Number to join on
+    sheets = []
+    for section in SCHEMA.sections:
+        ws = wb.create_sheet(section.name)
+        columns = SCHEMA.cover_columns if section.is_list else SCHEMA.section_fields[section.name]
+        key_columns = ["Source_File"] + ([] if "Policy_Number" in columns else ["Policy_Number"])
+        ws.append(key_columns + columns)
+        sheets.append((ws, section, len(key_columns) == 2))
+
+    policy_number_field = next(f for f in SCHEMA.fields if f.name == "Policy_Number")
+    fields["documents"] = 0
+    for file_name, data in results:
+        fields["documents"] += 1
+        policy_number = str(SCHEMA.get_value(data, policy_number_field))
+        for ws, section, with_policy_number in sheets:
+            keys = [file_name, policy_number] if with_policy_number else [file_name]
+            if section.is_list:
+                for row in SCHEMA.export_cover_rows(data):
+                    ws.append(keys + row)
+            else:
+                ws.append(keys + SCHEMA.export_row(data, section.name))
+
+    if output is not None:
+        wb.save(output)
+        return output
+    buffer = BytesIO()
+    wb.save(buffer)
+    buffer.seek(0)
+    return buffer
+
+def export_batch_tables(results, fmt):
+    """Export records as a policies table plus a covers child table, zipped"""
+    import zipfile
+
+    policies, covers = records_to_frames(results)
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for file_name, data in export_frames(policies, covers, fmt).items():
+            archive.writestr(file_name, data)
+    return buffer.getvalue()
+
+def flatten_json(extracted_data):
+    """Flatten the extracted JSON and format dates and values"""
+    return SCHEMA.flatten(extracted_data)
+
+def estimate_request_tokens(pdf_bytes):
+    """Rough token cost of one extraction call, used to budget tokens-per-minute."""
+    pages = max(1, len(re.findall(rb"/Type\s*/Page[^s]", pdf_bytes)))
+    # Gemini bills ~258 tokens per PDF page, plus the prompt and a typical JSON reply
+    return pages * 258 + 2000
+
+def request_extraction(pdf_bytes, section_fields, header=FULL_PROMPT_HEADER, on_field=None, retry_invalid=True):
+    """Ask Gemini for the given {section: [fields]} and return the validated sections.
+
+    Output is constrained to a JSON schema built from `section_fields`, then
+    decoded by a tolerant parser and validated against the section layout.
+    Streamed requests use plain JSON mode instead: the SDK's schema type
+    cannot fix property order, and the model then writes sections in an
+    arbitrary order rather than the prompt's, delaying the first-step fields.
+    Sections that come back missing, malformed or truncated are re-asked once
+    on their own instead of repeating the whole extraction.
+
+    The response is streamed; when `on_field` is given it is called with
+    (path, value) for each field as soon as it arrives.
+    """
+    registry = get_default_registry()
+    model = get_model()
+    with span("upload", bytes=len(pdf_bytes)):
+        handle = registry.get_or_upload(pdf_bytes)
+    contents = [build_prompt(section_fields, header=header), handle]
+    generation_config = dict(response_mime_type="application/json")
+    if on_field is None:
+        generation_config["response_schema"] = build_response_schema(section_fields)
+    request = dict(
+        generation_config=genai.GenerationConfig(**generation_config),
+        stream=True,
+        estimated_tokens=estimate_request_tokens(pdf_bytes)
+    )
+
+    with span("generate", sections=len(section_fields)) as fields:
+        try:
+            response = get_default_scheduler().call(model.generate_content, contents, **request)
+        except Exception as e:
+            if not is_stale_file_error(e):
+                raise
+            # The remote copy expired or was deleted; upload once more and retry
+            registry.invalidate(pdf_bytes)
+            with span("upload", bytes=len(pdf_bytes), reason="stale"):
+                contents[1] = registry.get_or_upload(pdf_bytes)
+            response = get_default_scheduler().call(model.generate_content, contents, **request)
+
+        parser = StreamingFieldParser()
+        chunks = []
+        usage = None
+        for chunk in response:
+            usage = getattr(chunk, "usage_metadata", None) or usage
+            try:
+                text = chunk.text
+            except ValueError:
+                continue
+            chunks.append(text)
+            if on_field:
+                for path, value in parser.feed(text):
+                    on_field(path, value)
+        usage = getattr(response, "usage_metadata", None) or usage
+        if usage:
+            fields["prompt_tokens"], fields["output_tokens"], fields["cost_usd"] = METRICS.record_usage(usage, MODEL_NAME)
+
+    response_text = "".join(chunks).strip()
+    if not response_text:
+        raise ValueError("No valid response text received from Gemini.")
+
+    with span("decode", chars=len(response_text)) as fields:
+        try:
+            data, incomplete_sections = decode_response(response_text)
+        except json.JSONDecodeError:
+            if not retry_invalid:
+                raise
+            data, incomplete_sections = {}, []
+
+        extracted, invalid_sections = validate_extraction(data, section_fields, incomplete_sections)
+        fields["invalid_sections"] = len(invalid_sections)
+    if invalid_sections and retry_invalid:
+        logger.warning("Re-asking Gemini for malformed sections: %s", ", ".join(invalid_sections))
+        extracted.update(request_extraction(
+            pdf_bytes,
+            {section: section_fields[section] for section in invalid_sections},
+            PARTIAL_PROMPT_HEADER,
+            on_field,
+            retry_invalid=False
+        ))
+    return extracted
+
+def extract_sections_in_parallel(pdf_bytes, section_fields, on_field=None, section_pages=None):
+    """Extract sections from only the pages that hold them, one request per page set.
+
+    Sections found on the same pages share a request. Returns the merged
+    extraction (same layout as a single full request) and the wall-clock
+    seconds spent on each section's request.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    if section_pages is None:
+        section_pages = locate_sections(pdf_bytes)
+    groups = {}
+    for section in section_fields:
+        groups.setdefault(tuple(section_pages[section]), []).append(section)
+    timings = {}
+
+    def extract_group(pages):
+        started = time.perf_counter()
+        result = request_extraction(
+            split_pages(pdf_bytes, pages),
+            {section: section_fields[section] for section in groups[pages]},
+            PARTIAL_PROMPT_HEADER,
+            on_field
+        )
+        for section in groups[pages]:
+            timings[section] = time.perf_counter() - started
+        return result
+
+    with ThreadPoolExecutor(max_workers=len(groups)) as executor:
+        results = list(executor.map(in_current_context(extract_group), groups))
+
+    merged = {}
+    for result in results:
+        merged.update(result)
+    merged = {section: merged[section] for section in section_fields}
+    logger.info(
+        "Per-section extraction timings: %s",
+        ", ".join(f"{section} ({len(section_pages[section])} pages) {timings[section]:.2f}s" for section in section_fields)
+    )
+    return merged, timings
+
+def request_fields(pdf_bytes, section_fields, header, on_field=None):
+    """Request the given sections, splitting long documents into per-section calls.
+
+    Splitting only pays off when some section sits on fewer pages than
+    another; scans (no text layer to place sections with) and documents
+    whose sections all share the same pages go out as one request.
+    """
+    if page_count(pdf_bytes) >= SECTION_SPLIT_MIN_PAGES:
+        section_pages = locate_sections(pdf_bytes)
+        if len({tuple(section_pages[section]) for section in section_fields}) > 1:
+            merged, _ = extract_sections_in_parallel(pdf_bytes, section_fields, on_field, section_pages)
+            return merged
+    return request_extraction(pdf_bytes, section_fields, header, on_field)
+
+def merge_extractions(prefilled, extracted):
+    """Fill the gaps in a text-layer extraction with values from Gemini"""
+    merged = {}
+    for section in SECTION_FIELDS:
+        if SCHEMA.section_by_name[section].is_list:
+            merged[section] = prefilled.get(section) or extracted.get(section, [])
+        else:
+            merged[section] = {**extracted.get(section, {}), **prefilled.get(section, {})}
+    return merged
+
+def extract_document(pdf_bytes, on_field=None, on_duplicates=None):
+    """Extract and flatten the fields of a PDF, using Gemini only where needed.
+
+    Digitally generated PDFs are first read from their text layer; Gemini is
+    asked only for the fields the local rules could not resolve, and is
+    skipped entirely when they resolve everything. Scans go straight to the
+    full Gemini extraction, after being shrunk by preprocess_pdf when
+    PREPROCESS_SCANS is set. Documents of SECTION_SPLIT_MIN_PAGES pages or
+    more are split so each section is requested from its own pages. With
+    DUPLICATE_ACTION=reuse, a text-layer document that is a near-duplicate of
+    an earlier one with agreeing identifiers takes the fields Gemini would
+    have been asked for from that record. Every extracted record is checked
+    against the duplicate index and then indexed; page hashes are only
+    computed for documents that need Gemini.
+
+    `on_field(path, value)` is called for every field as it becomes known:
+    text-layer values immediately, Gemini values as the response streams in.
+    `on_duplicates(matches)` is called with the flagged DuplicateMatch list
+    once the record is known.
+
+    Does not touch Streamlit, so it is safe to call from worker threads.
+    Raises on failure instead of reporting through st.error. Results are
+    read from and written to the shared on-disk extraction cache.
+    Each stage is timed with a telemetry span.
+    """
+    with document_trace(pdf_bytes) as trace:
+        return _extract_document(pdf_bytes, on_field, on_duplicates, trace)
+
+def _extract_document(pdf_bytes, on_field, on_duplicates, trace):
+    cache = get_default_cache()
+    cache_key = make_cache_key(pdf_bytes, MODEL_NAME, EXTRACTION_PROMPT)
+    with span("cache_lookup") as fields:
+        cached = cache.get(cache_key)
+        fields["hit"] = cached is not None
+    if cached is not None:
+        trace["outcome"] = "cached"
+        if on_duplicates:
+            # Identical bytes were indexed already; only other files can match, by key
+            on_duplicates(find_duplicates(pdf_bytes, cached, []))
+        return cached
+
+    with span("text_layer") as fields:
+        prefilled, missing = prefill_document(pdf_bytes)
+        fields["scanned"] = prefilled is None
+    if prefilled is not None and on_field:
+        for section, values in prefilled.items():
+            if SCHEMA.section_by_name[section].is_list:
+                for idx, cover in enumerate(values):
+                    for key, value in cover.items():
+                        on_field((section, idx, key), value)
+            else:
+                for field, value in values.items():
+                    on_field((section, field), value)
+
+    original_bytes = pdf_bytes
+    hashes = None
+    if prefilled is not None and missing and DUPLICATE_ACTION == "reuse":
+        hashes = hash_pages(pdf_bytes)
+        matches = find_duplicates(pdf_bytes, flatten_json(prefilled), hashes)
+        if matches and matches[0].reusable:
+            trace["outcome"] = "duplicate"
+            final_data = fill_from_duplicate(prefilled, missing, matches[0].record)
+            cache.set(cache_key, final_data)
+            report_duplicates(matches, on_duplicates)
+            get_default_index().add(original_bytes, final_data, hashes)
+            return final_data
+
+    trace["outcome"] = "gemini"
+    if prefilled is None:
+        if PREPROCESS_SCANS:
+            with span("preprocess") as fields:
+                pdf_bytes, stats = preprocess_pdf(pdf_bytes)
+                fields.update(stats)
+            trace["bytes_sent"] = len(pdf_bytes)
+        extracted_data = request_fields(pdf_bytes, SECTION_FIELDS, FULL_PROMPT_HEADER, on_field)
+    elif missing:
+        extracted_data = merge_extractions(prefilled, request_fields(
+            pdf_bytes,
+            {section: missing[section] for section in SECTION_FIELDS if section in missing},
+            PARTIAL_PROMPT_HEADER,
+            on_field
+        ))
+    else:
+        trace["outcome"] = "text_layer"
+        extracted_data = prefilled
+
+    with span("flatten"):
+        final_data = flatten_json(extracted_data)
+    cache.set(cache_key, final_data)
+    # Text-layer documents are matched by their identifiers alone; rendering
+    # their pages would cost more than the whole extraction
+    if hashes is None:
+        hashes = hash_pages(original_bytes) if trace["outcome"] == "gemini" else []
+    report_duplicates(find_duplicates(original_bytes, final_data, hashes), on_duplicates)
+    get_default_index().add(original_bytes, final_data, hashes)
+    return final_data
+
+def hash_pages(pdf_bytes):
+    """Perceptual page hashes for the duplicate index, timed as a span."""
+    with span("page_hashes") as fields:
+        hashes = page_hashes(pdf_bytes)
+        fields["pages"] = len(hashes)
+    return hashes
+
+def fill_from_duplicate(prefilled, missing, earlier):
+    """Flat record of the text-layer values, with the `missing` fields taken from `earlier`."""
+    record = flatten_json(prefilled)
+    for section, names in missing.items():
+        if SCHEMA.section_by_name[section].is_list:
+            record["covers"] = [dict(cover) for cover in earlier.get("covers", [])]
+            continue
+        for field in SCHEMA.fields_by_section[section]:
+            if field.name in names:
+                SCHEMA.set_value(record, field, SCHEMA.get_value(earlier, field))
+    return record
+
+def find_duplicates(pdf_bytes, record, hashes):
+    """Earlier documents worth flagging for this one, best match first.
+
+    `record` is a flat record, possibly partial; its key fields are matched
+    against the index, and a near-duplicate is only reusable when at least
+    one of them agrees and none contradict it.
+    """
+    with span("duplicate_lookup") as fields:
+        matches = [match for match in get_default_index().check(pdf_bytes, record, hashes) if match.flagged]
+        fields["matches"] = len(matches)
+    return matches
+
+def report_duplicates(matches, on_duplicates=None):
+    """Log and count the best of a new extraction's matches and pass them to `on_duplicates`."""
+    if matches:
+        best = matches[0]
+        kind = "near_duplicate" if best.near_duplicate else "key_match"
+        METRICS.inc("duplicate_documents_total", help="Documents resembling an earlier extraction", kind=kind)
+        emit("duplicate", kind=kind, of=best.content_hash[:12], matched_fields=",".join(best.matched_fields),
+             conflicting_fields=",".join(best.conflicting_fields), distance=best.distance)
+    if on_duplicates:
+        on_duplicates(matches)
+
+def describe_extraction_error(error):
+    """User-facing message for an exception raised by extract_document"""
+    if isinstance(error, json.JSONDecodeError):
+        return f"JSON parsing error: {str(error)} - Raw response: {error.doc}"
+    if isinstance(error, ValueError):
+        return str(error)
+    return f"Processing error: {str(error)}"
+
+def process_documents_batch(documents, max_workers=BATCH_MAX_WORKERS, on_progress=None):
+    """Extract many PDFs concurrently over a bounded thread pool.
+
+    `documents` is a list of (file_name, pdf_bytes) pairs. Returns a list of
+    (file_name, record, error) tuples in input order; `on_progress` is called
+    from the calling thread as (index, file_name, status) for each document.
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    results = [None] * len(documents)
+    with ThreadPoolExecutor(max_workers=max(1, int(max_workers))) as executor:
+        futures = {
+            executor.submit(extract_document, pdf_bytes): idx
+            for idx, (_, pdf_bytes) in enumerate(documents)
+        }
+        for future in as_completed(futures):
+            idx = futures[future]
+            file_name = documents[idx][0]
+            try:
+                results[idx] = (file_name, future.result(), None)
+                status = "done"
+            except Exception as e:
+                results[idx] = (file_name, None, str(e))
+                status = "failed"
+            if on_progress:
+                on_progress(idx, file_name, status)
+    return results
@@ -0,0 +1,250 @@
+"""Declarative description of the proposal form.
+
+Every field is declared once here, with its section, type, record path and
+the printed labels the text-layer rules look for. The Gemini prompt and
+response schema, flatten_json, the review widgets and every exporter are
+derived from SCHEMA, so adding a field is a single edit to FIELDS.
+"""
+from dataclasses import dataclass
+
+from normalize import format_numeric_value, format_numeric_values, standardize_date, standardize_dates
+
+COVERAGE_SECTION = "Insurance Coverage"
+
+
+def normalize_signature(value):
+    """Keep a readable proposer name; any other mark becomes 'available'."""
+    value = "" if value is None else str(value)
+    if not value.strip():
+        return ""
+    return value if any(c.isalpha() for c in value) else "available"
+
+
+def _identity(value):
+    return value
+
+
+def _as_str(value):
+    return "" if value is None else str(value)
+
+
+# Applied when flattening Gemini / text-layer output into a record
+FLATTEN_NORMALIZERS = {
+    "text": _identity,
+    "date": standardize_date,
+    "amount": format_numeric_value,
+    "signature": normalize_signature,
+}
+# Applied to each cell when writing a record to a spreadsheet
+EXPORT_NORMALIZERS = {
+    "text": _as_str,
+    "date": standardize_date,
+    "amount": format_numeric_value,
+    "signature": _as_str,
+}
+# Column-wise equivalents for batch exports; types not listed are left as-is
+COLUMN_NORMALIZERS = {
+    "date": standardize_dates,
+    "amount": format_numeric_values,
+}
+# Applied to values typed into the review forms before they are stored
+EDIT_NORMALIZERS = {
+    "signature": normalize_signature,
+}
+
+
+@dataclass(frozen=True)
+class Section:
+    name: str
+    title: str
+    prompt: str
+    widget_prefix: str = ""
+    keywords: tuple = ()
+    is_list: bool = False
+
+
+@dataclass(frozen=True)
+class Field:
+    name: str
+    section: str
+    type: str = "text"
+    labels: tuple = ()
+    record_path: tuple = ()
+
+    @property
+    def label(self):
+        return self.name.replace('_', ' ').title()
+
+    @property
+    def path(self):
+        return self.record_path or (self.name,)
+
+
+SECTIONS = (
+    Section(
+        "Policy & Vehicle Details", "📋 Policy & Vehicle Details",
+        "'Policy & Vehicle Details' including {fields}",
+        widget_prefix="policy_",
+        keywords=(r"Policy\s*No", r"Full\s*Name", r"NIC", r"Postal\s*Address", r"Mobile",
+                  r"E-?mail", r"Financial\s*Interest", r"Occupation", r"Registered\s*Owner"),
+    ),
+    Section(
+        "Vehicle Information", "🚗 Vehicle Information",
+        "'Vehicle Information' including {fields}",
+        widget_prefix="vehicle_",
+        keywords=(r"Chassis", r"Registration\s*No", r"Make\s*(?:&|and|/)\s*Model", r"Cubic\s*Capacity",
+                  r"Seating\s*Capacity", r"Fuel", r"Market\s*Value", r"Sum\s*Insured"),
+    ),
+    Section(
+        COVERAGE_SECTION, "🛡️ Insurance Coverage",
+        "'Insurance Coverage' as a list of objects representing all additional coverage options that are ticked, marked, or selected in the form. Each object should include: 'Cover Type' (the name/description of the coverage), 'Amount' (any specified value or limit, if provided, otherwise empty string), and 'Additional Info' (any extra details related to that coverage). Include all ticked/marked coverages from sections like 'Additional Covers'",
+        keywords=(r"Additional\s*Covers?", r"Cover\s*Type", r"SRCC", r"Strike", r"Flood",
+                  r"Personal\s*Accident", r"Windscreen"),
+        is_list=True,
+    ),
+    Section(
+        "Policy & Proposer", "📅 Policy & Proposer Details",
+        "'Policy & Proposer' including {fields}",
+        widget_prefix="proposer_",
+        keywords=(r"Period\s*(?:of\s*Insurance|From)", r"Signature", r"Declaration", r"Proposer'?s?\s*Date"),
+    ),
+)
+
+_POLICY = "Policy & Vehicle Details"
+_VEHICLE = "Vehicle Information"
+_PROPOSER = "Policy & Proposer"
+
+FIELDS = (
+    Field("Policy_Number", _POLICY, labels=(r"Policy\s*(?:No\.?|Number)",)),
+    Field("Full_Name", _POLICY, labels=(r"Full\s*Name", r"Name\s+of\s+(?:the\s+)?Proposer")),
+    Field("NIC_or_Reg_No", _POLICY, labels=(r"NIC\s*(?:/|or)\s*(?:Business\s*)?Reg(?:istration)?\.?\s*No\.?", r"NIC\s*No\.?")),
+    Field("Postal_Address", _POLICY, labels=(r"Postal\s*Address",)),
+    Field("Mobile", _POLICY, labels=(r"Mobile(?:\s*No\.?)?",)),
+    Field("Landline", _POLICY, labels=(r"Land\s*line(?:\s*No\.?)?", r"Telephone(?:\s*No\.?)?")),
+    Field("Email", _POLICY, labels=(r"E-?mail(?:\s*Address)?",)),
+    Field("preferred_language", _POLICY, labels=(r"Preferred\s*Language",)),
+    Field("Financial_Interest", _POLICY, labels=(r"Financial\s*Interest",)),
+    Field("Accident_free_or_other_damages", _POLICY, labels=(r"Accident\s*Free(?:\s*(?:/|or)\s*Other\s*Damages)?",)),
+    Field("Claims_in_Last_3_Years", _POLICY, labels=(r"Claims\s*in\s*(?:the\s*)?Last\s*(?:3|Three)\s*Years",)),
+    Field("Registered_Owner", _POLICY, labels=(r"Registered\s*Owner",)),
+    Field("Business_Occupation", _POLICY, labels=(r"Business\s*(?:/|or)\s*Occupation", r"Occupation")),
+
+    Field("Make_Model", _VEHICLE, labels=(r"Make\s*(?:&|and|/)\s*Model",)),
+    Field("Registration_No", _VEHICLE, labels=(r"(?:Vehicle\s*)?Registration\s*(?:No\.?|Number)", r"Reg\.\s*No\.?")),
+    Field("Chassis_No", _VEHICLE, labels=(r"Chassis\s*(?:No\.?|Number)",)),
+    Field("Year_of_Make", _VEHICLE, "date", labels=(r"Year\s*of\s*(?:Make|Manufacture)",)),
+    Field("First_Registration_Date", _VEHICLE, "date", labels=(r"(?:Date\s*of\s*)?First\s*Registration(?:\s*Date)?",)),
+    Field("Country_of_Make", _VEHICLE, labels=(r"Country\s*of\s*(?:Make|Origin)",)),
+    Field("Fuel_Type", _VEHICLE, labels=(r"Fuel\s*Type",)),
+    Field("Cubic_Capacity", _VEHICLE, labels=(r"Cubic\s*Capacity", r"Engine\s*Capacity")),
+    Field("Seating_Capacity", _VEHICLE, labels=(r"Seating\s*Capacity",)),
+    Field("Vehicle_Registered_As", _VEHICLE, labels=(r"(?:Vehicle\s*)?Registered\s*As",)),
+    Field("Usage_of_Vehicle", _VEHICLE, labels=(r"(?:Usage|Use)\s*of\s*(?:the\s*)?Vehicle",)),
+    Field("Market_Value", _VEHICLE, "amount", labels=(r"Market\s*Value",)),
+    Field("Extra_Fittings_Value", _VEHICLE, "amount", labels=(r"(?:Value\s*of\s*)?Extra\s*Fittings(?:\s*Value)?",)),
+    Field("Total_Value_Insured", _VEHICLE, "amount", labels=(r"Total\s*(?:Value|Sum)\s*Insured",)),
+
+    Field("Period_From", _PROPOSER, "date", labels=(r"Period\s*(?:of\s*Insurance\s*)?From",)),
+    Field("Period_To", _PROPOSER, "date", labels=(r"Period\s*(?:of\s*Insurance\s*)?To",)),
+    Field("Proposer_Date", _PROPOSER, "date", labels=(r"Proposer'?s?\s*Date", r"Date\s*of\s*Proposal"),
+          record_path=("proposer_details", "date")),
+    Field("Proposer_Signature", _PROPOSER, "signature",
+          labels=(r"(?:Signature\s*of\s*(?:the\s*)?Proposer|Proposer'?s?\s*Signature)",),
+          record_path=("proposer_details", "proposer_signature")),
+)
+
+# Columns of each coverage row, with their types
+COVER_COLUMNS = (("Cover Type", "text"), ("Amount", "amount"), ("Additional Info", "text"))
+
+
+class FormSchema:
+    """Compiled view of SECTIONS and FIELDS with the lookups the hot paths need."""
+
+    def __init__(self, sections, fields, cover_columns):
+        self.sections = tuple(sections)
+        self.fields = tuple(fields)
+        self.section_by_name = {section.name: section for section in self.sections}
+        self.fields_by_section = {
+            section.name: tuple(f for f in self.fields if f.section == section.name)
+            for section in self.sections
+        }
+        # {section: [field names]}, the shape the prompt and response schema use
+        self.section_fields = {
+            name: [f.name for f in fields] for name, fields in self.fields_by_section.items()
+        }
+        self.field_names = [f.name for f in self.fields]
+        self.cover_columns = [name for name, _ in cover_columns]
+        self.cover_types = dict(cover_columns)
+
+        self._flatten_plan = tuple(
+            (section.name, None) if section.is_list else
+            (section.name, tuple((f.name, f.path, FLATTEN_NORMALIZERS[f.type]) for f in self.fields_by_section[section.name]))
+            for section in self.sections
+        )
+        self._cover_plan = tuple((name, FLATTEN_NORMALIZERS[kind]) for name, kind in cover_columns)
+        self._export_plan = {
+            section.name: tuple((f.path, EXPORT_NORMALIZERS[f.type]) for f in self.fields_by_section[section.name])
+            for section in self.sections if not section.is_list
+        }
+        self._cover_export_plan = tuple((name, EXPORT_NORMALIZERS[kind]) for name, kind in cover_columns)
+
+    def fields_of_type(self, kind):
+        return [f for f in self.fields if f.type == kind]
+
+    def flatten(self, extracted):
+        """Turn the sectioned extraction into a flat record, normalizing each field."""
+        record = {}
+        for section, plan in self._flatten_plan:
+            values = extracted.get(section) or ({} if plan is not None else [])
+            if plan is None:
+                record["covers"] = [
+                    {name: normalize(cover.get(name, "")) for name, normalize in self._cover_plan}
+                    for cover in values if isinstance(cover, dict)
+                ]
+                continue
+            for name, path, normalize in plan:
+                value = normalize(values.get(name, ""))
+                if len(path) == 1:
+                    record[path[0]] = value
+                else:
+                    record.setdefault(path[0], {})[path[1]] = value
+        return record
+
+    @staticmethod
+    def get_value(record, field):
+        value = record
+        for key in field.path:
+            value = value.get(key, "") if isinstance(value, dict) else ""
+        return value
+
+    @staticmethod
+    def set_value(record, field, value):
+        target = record
+        for key in field.path[:-1]:
+            # Copy nested dicts so shallow copies of a record never share edits
+            target[key] = dict(target[key]) if isinstance(target.get(key), dict) else {}
+            target = target[key]
+        target[field.path[-1]] = value
+
+    def export_row(self, record, section):
+        """Spreadsheet cell values for one record's row in a section's sheet."""
+        row = []
+        for path, normalize in self._export_plan[section]:
+            value = record
+            for key in path:
+                value = value.get(key, "") if isinstance(value, dict) else ""
+            row.append(normalize(value))
+        return row
+
+    def export_cover_rows(self, record):
+        """Spreadsheet rows for a record's coverage list (a list or DataFrame)."""
+        covers = record.get("covers") or []
+        if hasattr(covers, "to_dict"):
+            covers = covers.to_dict('records')
+        return [
+            [normalize(cover.get(name, "")) for name, normalize in self._cover_export_plan]
+            for cover in covers
+        ]
+
+
+SCHEMA = FormSchema(SECTIONS, FIELDS, COVER_COLUMNS)
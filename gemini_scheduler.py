@@ -0,0 +1,173 @@
+import os
+import random
+import re
+import threading
+import time
+from itertools import count
+
+
+class RateLimitError(Exception):
+    """Raised when a request is still rate limited after every retry."""
+
+
+def is_rate_limit_error(error):
+    """True for 429 / ResourceExhausted errors from the Gemini client (or a fake client).
+
+    Other quota failures (e.g. a 403 for a misconfigured quota project) are
+    not transient and are not retried.
+    """
+    if getattr(error, "code", None) == 429 or getattr(error, "status_code", None) == 429:
+        return True
+    return any(cls.__name__ == "ResourceExhausted" for cls in type(error).__mro__)
+
+
+def retry_after_seconds(error):
+    """Extract a server retry hint (seconds) from an error, or None."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    value = headers.get("Retry-After") or headers.get("retry-after")
+    if value:
+        try:
+            return float(value)
+        except ValueError:
+            pass
+    text = str(error)
+    match = re.search(r"retry_delay\s*\{\s*seconds:\s*(\d+)", text)
+    if match is None:
+        match = re.search(r"retry (?:after|in) (\d+(?:\.\d+)?)\s*s", text, re.IGNORECASE)
+    return float(match.group(1)) if match else None
+
+
+class _TokenBucket:
+    def __init__(self, per_minute, clock):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = float(per_minute)
+        self.clock = clock
+        self.updated = clock()
+
+    def refill(self):
+        now = self.clock()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+
+class RequestScheduler:
+    """Process-wide request scheduler for Gemini calls.
+
+    Callers are admitted strictly in arrival order, so concurrent sessions
+    share the requests-per-minute and tokens-per-minute budget fairly. Rate
+    limit errors are retried with exponential backoff and full jitter; a
+    server retry hint, when present, is honoured and pauses every queued
+    caller, since the quota is shared. `clock`, `sleep` and `rng` can be
+    swapped out to drive the scheduler from a fake client in tests.
+    """
+
+    def __init__(self, requests_per_minute=15, tokens_per_minute=1_000_000, max_retries=5,
+                 base_delay=2.0, max_delay=60.0, clock=time.monotonic, sleep=time.sleep, rng=None):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.clock = clock
+        self.sleep = sleep
+        self.rng = rng or random.Random()
+        self.retries = 0
+        self._requests = _TokenBucket(requests_per_minute, clock)
+        self._tokens = _TokenBucket(tokens_per_minute, clock)
+        self._paused_until = 0.0
+        self._tickets = count()
+        self._serving = 0
+        self._cond = threading.Condition()
+
+    def _acquire(self, estimated_tokens):
+        with self._cond:
+            ticket = next(self._tickets)
+            while True:
+                if ticket == self._serving:
+                    self._requests.refill()
+                    self._tokens.refill()
+                    wait = max(
+                        self._paused_until - self.clock(),
+                        self._requests.wait_time(1),
+                        self._tokens.wait_time(estimated_tokens),
+                    )
+                    if wait <= 0:
+                        self._requests.level -= 1
+                        self._tokens.level -= min(estimated_tokens, self._tokens.capacity)
+                        self._serving += 1
+                        self._cond.notify_all()
+                        return
+                    # Wait on the injectable sleep (not the condition's real-time
+                    # timeout) so a fake clock drives the budget too; callers
+                    # behind this ticket stay blocked on the condition meanwhile
+                    self._cond.release()
+                    try:
+                        self.sleep(wait)
+                    finally:
+                        self._cond.acquire()
+                else:
+                    self._cond.wait()
+
+    def _settle(self, estimated_tokens, response):
+        usage = getattr(response, "usage_metadata", None)
+        actual = getattr(usage, "total_token_count", None)
+        if actual:
+            with self._cond:
+                self._tokens.level -= actual - estimated_tokens
+
+    def _pause(self, seconds):
+        with self._cond:
+            self._paused_until = max(self._paused_until, self.clock() + seconds)
+
+    def backoff_delay(self, attempt):
+        """Full-jitter exponential backoff for the given retry attempt."""
+        return self.rng.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def call(self, fn, *args, estimated_tokens=1, **kwargs):
+        """Run `fn(*args, **kwargs)` within the budget, retrying rate-limit errors."""
+        for attempt in range(self.max_retries + 1):
+            self._acquire(estimated_tokens)
+            try:
+                response = fn(*args, **kwargs)
+            except Exception as e:
+                if not is_rate_limit_error(e):
+                    raise
+                if attempt == self.max_retries:
+                    raise RateLimitError(
+                        f"Gemini rate limit persisted after {self.max_retries} retries: {e}"
+                    ) from e
+                with self._cond:
+                    self.retries += 1
+                hint = retry_after_seconds(e)
+                if hint is not None:
+                    self._pause(hint)
+                    delay = hint
+                else:
+                    delay = self.backoff_delay(attempt)
+                self.sleep(delay)
+                continue
+            self._settle(estimated_tokens, response)
+            return response
+
+
+_default_scheduler = None
+_default_scheduler_lock = threading.Lock()
+
+
+def get_default_scheduler():
+    """Process-wide scheduler configured from GEMINI_* environment variables."""
+    global _default_scheduler
+    with _default_scheduler_lock:
+        if _default_scheduler is None:
+            _default_scheduler = RequestScheduler(
+                requests_per_minute=float(os.getenv("GEMINI_RPM", "15")),
+                tokens_per_minute=float(os.getenv("GEMINI_TPM", "1000000")),
+                max_retries=int(os.getenv("GEMINI_MAX_RETRIES", "5")),
+            )
+        return _default_scheduler
@@ -0,0 +1,175 @@
+import json
+from dataclasses import asdict
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobQueue:
+    """Local background queue for document extractions, persisted in SQLite.
+
+    `submit` stores the document and returns a job ID straight away; a
+    bounded worker pool shared by every session runs `run_fn(pdf_bytes,
+    on_field, on_duplicates)` and records the status, the fields streamed so
+    far, the duplicate matches reported and the result or error. Callers poll `get`. Streamed fields are written at most
+    every `flush_seconds` (the first one straight away), not once per field.
+    Jobs that were queued or running when the process stopped are picked up
+    again on start.
+    """
+
+    def __init__(self, path, run_fn, max_workers=4, describe_error=str, retention_seconds=24 * 3600,
+                 flush_seconds=0.5):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.run_fn = run_fn
+        self.describe_error = describe_error
+        self.retention_seconds = retention_seconds
+        self.flush_seconds = flush_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, file_name TEXT NOT NULL, status TEXT NOT NULL, "
+            "pdf BLOB, partial TEXT NOT NULL DEFAULT '[]', duplicates TEXT NOT NULL DEFAULT '[]', "
+            "result TEXT, error TEXT, "
+            "created REAL NOT NULL, started REAL, first_field REAL, finished REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)")
+        self._executor = ThreadPoolExecutor(max_workers=max(1, int(max_workers)), thread_name_prefix="extract-job")
+        self._recover()
+
+    def submit(self, pdf_bytes, file_name=""):
+        """Queue `pdf_bytes` for extraction and return the new job's ID."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, file_name, status, pdf, created) VALUES (?, ?, ?, ?, ?)",
+                (job_id, file_name, QUEUED, sqlite3.Binary(pdf_bytes), now)
+            )
+            self._prune(now)
+        self._executor.submit(self._run, job_id, pdf_bytes)
+        return job_id
+
+    def get(self, job_id):
+        """Current state of a job as a dict, or None if it is unknown or expired.
+
+        `partial` lists the (path, value) fields streamed so far, `result` is
+        the finished record, `duplicates` the reported matches as dicts and
+        `time_to_first_field` is measured from the moment a worker picked the
+        job up.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, file_name, status, partial, duplicates, result, error, created, started, "
+                "first_field, finished FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        (job_id, file_name, status, partial, duplicates, result, error, created, started,
+         first_field, finished) = row
+        return {
+            "id": job_id,
+            "file_name": file_name,
+            "status": status,
+            "partial": [(tuple(path), value) for path, value in json.loads(partial)],
+            "duplicates": json.loads(duplicates),
+            "result": json.loads(result) if result is not None else None,
+            "error": error,
+            "created": created,
+            "started": started,
+            "finished": finished,
+            "time_to_first_field": first_field - started if first_field and started else None,
+        }
+
+    def _run(self, job_id, pdf_bytes):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, started = ? WHERE id = ?", (RUNNING, time.time(), job_id)
+            )
+        partial = []
+        duplicates = []
+        flushed = [None]
+
+        def on_field(path, value):
+            partial.append((list(path), value))
+            now = time.time()
+            if flushed[0] is not None and now - flushed[0] < self.flush_seconds:
+                return
+            flushed[0] = now
+            with self._lock:
+                self._conn.execute(
+                    "UPDATE jobs SET partial = ?, first_field = COALESCE(first_field, ?) WHERE id = ?",
+                    (json.dumps(partial), now, job_id)
+                )
+
+        def on_duplicates(matches):
+            duplicates[:] = [asdict(match) for match in matches]
+
+        try:
+            record = self.run_fn(pdf_bytes, on_field, on_duplicates)
+        except Exception as e:
+            self._finish(job_id, FAILED, partial, duplicates, error=self.describe_error(e))
+        else:
+            self._finish(job_id, DONE, partial, duplicates, result=json.dumps(record))
+
+    def _finish(self, job_id, status, partial, duplicates, result=None, error=None):
+        # The document is only kept until the job no longer needs re-running
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, partial = ?, duplicates = ?, result = ?, error = ?, finished = ?, "
+                "pdf = NULL WHERE id = ?",
+                (status, json.dumps(partial), json.dumps(duplicates), result, error, time.time(), job_id)
+            )
+
+    def _recover(self):
+        with self._lock:
+            pending = self._conn.execute(
+                "SELECT id, pdf FROM jobs WHERE status IN (?, ?) ORDER BY created", (QUEUED, RUNNING)
+            ).fetchall()
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, started = NULL, first_field = NULL, partial = '[]' "
+                "WHERE status = ?", (QUEUED, RUNNING)
+            )
+        for job_id, pdf_bytes in pending:
+            self._executor.submit(self._run, job_id, bytes(pdf_bytes))
+
+    def _prune(self, now):
+        self._conn.execute(
+            "DELETE FROM jobs WHERE status IN (?, ?) AND finished < ?",
+            (DONE, FAILED, now - self.retention_seconds)
+        )
+
+
+_default_queue = None
+_default_queue_lock = threading.Lock()
+
+
+def get_default_queue(run_fn, describe_error=str):
+    """Process-wide queue configured from JOB_* environment variables.
+
+    `run_fn` and `describe_error` are bound by the first caller.
+    """
+    global _default_queue
+    with _default_queue_lock:
+        if _default_queue is None:
+            _default_queue = JobQueue(
+                os.getenv("JOB_QUEUE_PATH", os.path.join(".cache", "jobs.sqlite3")),
+                run_fn,
+                max_workers=int(os.getenv("JOB_WORKERS", "4")),
+                describe_error=describe_error,
+                retention_seconds=float(os.getenv("JOB_RETENTION_HOURS", "24")) * 3600,
+                # Twice per UI poll, so every poll sees the fields streamed so far
+                flush_seconds=float(os.getenv("JOB_POLL_SECONDS", "1")) / 2,
+            )
+        return _default_queue
@@ -0,0 +1,98 @@
+import re
+from datetime import datetime
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+DATE_FORMATS = ("%d/%m/%Y", "%d-%m-%Y", "%Y-%m-%d", "%d %b %Y", "%d %B %Y")
+
+_NON_NUMERIC = re.compile(r'[^0-9.,]')
+
+
+# Date and Value Formatting Functions
+@lru_cache(maxsize=65536)
+def _standardize_date_str(date_str):
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(date_str.strip(), fmt).strftime("%d/%m/%Y")
+        except ValueError:
+            continue
+    return date_str  # Return original if parsing fails
+
+def standardize_date(date_str):
+    """Convert different date formats to DD/MM/YYYY."""
+    if not date_str or not isinstance(date_str, str):
+        return ""
+    return _standardize_date_str(date_str)
+
+@lru_cache(maxsize=65536)
+def _format_numeric_str(value):
+    value = _NON_NUMERIC.sub('', value)  # Remove non-numeric characters
+    try:
+        numeric_value = float(value.replace(',', ''))
+        return f"{numeric_value:,.0f}"  # Format with commas
+    except ValueError:
+        return value  # Return original if conversion fails
+
+def format_numeric_value(value):
+    """Format numeric values with commas as thousand separators."""
+    if not value:
+        return ""
+    return _format_numeric_str(str(value))
+
+
+# Column-wise versions for batches of records. Each distinct raw value is
+# normalized once, and the date formats are tried once per column against all
+# still-unparsed values instead of once per cell.
+
+def _factorize(values):
+    series = values if isinstance(values, pd.Series) else pd.Series(list(values), dtype=object)
+    codes, uniques = pd.factorize(series.astype(object), use_na_sentinel=False)
+    return series, codes, pd.Series(uniques, dtype=object)
+
+def _expand(series, codes, normalized_uniques):
+    return pd.Series(normalized_uniques.to_numpy(dtype=object)[codes], index=series.index, dtype=object)
+
+def standardize_dates(values):
+    """Vectorized standardize_date over a column; returns a Series of strings."""
+    series, codes, uniques = _factorize(values)
+    result = pd.Series([""] * len(uniques), dtype=object)
+    is_text = uniques.map(lambda value: isinstance(value, str) and value != "")
+
+    pending = uniques[is_text]
+    stripped = pending.str.strip()
+    for fmt in DATE_FORMATS:
+        if pending.empty:
+            break
+        parsed = pd.to_datetime(stripped, format=fmt, errors="coerce")
+        hit = parsed.notna()
+        if hit.any():
+            result[hit[hit].index] = parsed[hit].dt.strftime("%d/%m/%Y")
+            pending, stripped = pending[~hit], stripped[~hit]
+    # Whatever pandas could not parse (including dates outside its range)
+    # goes through the scalar path so results stay identical
+    for idx, value in pending.items():
+        result[idx] = standardize_date(value)
+    return _expand(series, codes, result)
+
+def format_numeric_values(values):
+    """Vectorized format_numeric_value over a column; returns a Series of strings."""
+    series, codes, uniques = _factorize(values)
+    result = pd.Series([""] * len(uniques), dtype=object)
+    is_text = uniques.map(lambda value: isinstance(value, str))
+
+    for idx, value in uniques[~is_text].items():
+        result[idx] = format_numeric_value(value)
+
+    text = uniques[is_text & (uniques != "")]
+    digits = text.str.replace(_NON_NUMERIC, "", regex=True).str.replace(",", "", regex=False)
+    valid = pd.to_numeric(digits, errors="coerce").notna()
+    # to_numeric only screens the values: it is not correctly rounded, so the
+    # conversion itself goes through float() to match the scalar path exactly
+    numbers = digits[valid].to_numpy(dtype=object).astype(np.float64)
+    for idx, number in zip(digits[valid].index, numbers):
+        result[idx] = f"{number:,.0f}"
+    for idx, value in text[~valid].items():
+        result[idx] = format_numeric_value(value)
+    return _expand(series, codes, result)
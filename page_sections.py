@@ -0,0 +1,42 @@
+import re
+
+import pymupdf
+
+from field_schema import SCHEMA
+
+# Printed cues that identify which pages carry each section of the proposal form
+_COMPILED_KEYWORDS = {
+    section.name: re.compile("|".join(section.keywords), re.IGNORECASE)
+    for section in SCHEMA.sections
+}
+
+
+def page_count(pdf_bytes):
+    """Number of pages in the PDF."""
+    with pymupdf.open(stream=pdf_bytes, filetype="pdf") as doc:
+        return doc.page_count
+
+
+def locate_sections(pdf_bytes):
+    """Map each section to the (0-based) pages whose text mentions it.
+
+    Sections with no matching page (e.g. every page of a scan) map to all
+    pages, so nothing is lost when the text layer is missing.
+    """
+    with pymupdf.open(stream=pdf_bytes, filetype="pdf") as doc:
+        texts = [page.get_text("text") for page in doc]
+    all_pages = list(range(len(texts)))
+    return {
+        section: [idx for idx, text in enumerate(texts) if pattern.search(text)] or all_pages
+        for section, pattern in _COMPILED_KEYWORDS.items()
+    }
+
+
+def split_pages(pdf_bytes, pages):
+    """Return a new PDF holding only the given (0-based) pages."""
+    with pymupdf.open(stream=pdf_bytes, filetype="pdf") as src, pymupdf.open() as dst:
+        if list(pages) == list(range(src.page_count)):
+            return pdf_bytes
+        for idx in pages:
+            dst.insert_pdf(src, from_page=idx, to_page=idx)
+        return dst.tobytes(garbage=3, deflate=True)
@@ -0,0 +1,102 @@
+import io
+import os
+
+import numpy as np
+import pymupdf
+
+try:
+    from PIL import Image
+except ImportError:  # Deskewing needs Pillow; the other steps only need PyMuPDF
+    Image = None
+
+# Preprocess scanned documents before upload (off unless PREPROCESS_SCANS=1)
+PREPROCESS_SCANS = os.getenv("PREPROCESS_SCANS", "0").lower() in ("1", "true", "yes")
+PREPROCESS_DPI = int(os.getenv("PREPROCESS_DPI", "150"))
+PREPROCESS_JPEG_QUALITY = int(os.getenv("PREPROCESS_JPEG_QUALITY", "75"))
+PREPROCESS_DESKEW = os.getenv("PREPROCESS_DESKEW", "1").lower() in ("1", "true", "yes")
+# Pages with less than this share of dark pixels are treated as blank
+PREPROCESS_BLANK_INK_RATIO = float(os.getenv("PREPROCESS_BLANK_INK_RATIO", "0.002"))
+
+MAX_SKEW_DEGREES = 5.0
+_INK_LEVEL = 160
+_SKEW_SAMPLE_WIDTH = 600
+
+
+def _native_dpi(page):
+    """Resolution of the largest image on the page, or None for vector pages."""
+    best = None
+    for info in page.get_image_info():
+        width = pymupdf.Rect(info["bbox"]).width
+        if width > 0:
+            dpi = info["width"] * 72 / width
+            best = dpi if best is None else max(best, dpi)
+    return best
+
+
+def _render_gray(page, dpi):
+    # Never render above the scan's own resolution: that only adds bytes
+    native = _native_dpi(page)
+    dpi = max(36, int(min(dpi, native) if native else dpi))
+    pixmap = page.get_pixmap(dpi=dpi, colorspace=pymupdf.csGRAY, alpha=False)
+    gray = np.frombuffer(pixmap.samples, dtype=np.uint8).reshape(pixmap.height, pixmap.stride)[:, :pixmap.width]
+    return gray, pixmap
+
+
+def estimate_skew(gray, max_degrees=MAX_SKEW_DEGREES):
+    """Angle (degrees) that best levels the text lines, by projection-profile search.
+
+    Rotating a binarized thumbnail through candidate angles, the straightened
+    page is the one whose row ink sums vary the most (sharp line/gap rhythm).
+    """
+    ink = Image.fromarray(np.where(gray < _INK_LEVEL, 255, 0).astype(np.uint8))
+    if ink.width > _SKEW_SAMPLE_WIDTH:
+        ink = ink.resize((_SKEW_SAMPLE_WIDTH, max(1, ink.height * _SKEW_SAMPLE_WIDTH // ink.width)))
+
+    def score(angle):
+        rotated = np.asarray(ink.rotate(angle, resample=Image.NEAREST, fillcolor=0), dtype=np.float32)
+        return float(np.var(rotated.sum(axis=1)))
+
+    best = max(np.arange(-max_degrees, max_degrees + 0.01, 0.5), key=score)
+    return float(max(np.arange(best - 0.4, best + 0.41, 0.1), key=score))
+
+
+def _encode_page(gray, pixmap, jpeg_quality, deskew):
+    if deskew and Image is not None:
+        angle = estimate_skew(gray)
+        if abs(angle) >= 0.2:
+            image = Image.fromarray(gray).rotate(angle, resample=Image.BICUBIC, fillcolor=255)
+            buffer = io.BytesIO()
+            image.save(buffer, "JPEG", quality=jpeg_quality, optimize=True)
+            return buffer.getvalue(), True
+    return pixmap.tobytes("jpeg", jpg_quality=jpeg_quality), False
+
+
+def preprocess_pdf(pdf_bytes, dpi=PREPROCESS_DPI, jpeg_quality=PREPROCESS_JPEG_QUALITY,
+                   deskew=PREPROCESS_DESKEW, blank_ink_ratio=PREPROCESS_BLANK_INK_RATIO):
+    """Shrink a scanned PDF before upload.
+
+    Each page is rasterized in grayscale at no more than `dpi`, deskewed
+    (when Pillow is installed), JPEG-compressed and placed on a page of the
+    original size; blank pages are dropped. Returns (pdf_bytes, stats). The
+    original bytes come back unchanged when the rebuilt file would not be
+    smaller or every page looks blank.
+    """
+    stats = {"bytes_before": len(pdf_bytes), "pages_before": 0, "blank_pages": 0, "deskewed_pages": 0}
+    with pymupdf.open(stream=pdf_bytes, filetype="pdf") as src, pymupdf.open() as dst:
+        stats["pages_before"] = src.page_count
+        for page in src:
+            gray, pixmap = _render_gray(page, dpi)
+            if (gray < _INK_LEVEL).mean() < blank_ink_ratio:
+                stats["blank_pages"] += 1
+                continue
+            image, deskewed = _encode_page(gray, pixmap, jpeg_quality, deskew)
+            stats["deskewed_pages"] += deskewed
+            new_page = dst.new_page(width=page.rect.width, height=page.rect.height)
+            new_page.insert_image(new_page.rect, stream=image)
+        rebuilt = dst.tobytes(garbage=3, deflate=True) if dst.page_count else None
+
+    if rebuilt is None or len(rebuilt) >= len(pdf_bytes):
+        stats.update(bytes_after=len(pdf_bytes), pages_after=stats["pages_before"], applied=False)
+        return pdf_bytes, stats
+    stats.update(bytes_after=len(rebuilt), pages_after=stats["pages_before"] - stats["blank_pages"], applied=True)
+    return rebuilt, stats
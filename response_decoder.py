@@ -0,0 +1,251 @@
+import json
+
+from field_schema import SCHEMA
+
+COVER_KEYS = SCHEMA.cover_columns
+
+_WHITESPACE = " \t\r\n"
+_LITERALS = {"true": True, "false": False, "null": None, "True": True, "False": False, "None": None}
+_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f", "/": "/", "\\": "\\", '"': '"', "'": "'"}
+
+
+def build_response_schema(section_fields):
+    """JSON schema for Gemini's structured output covering the requested sections."""
+    properties = {}
+    for section, fields in section_fields.items():
+        if SCHEMA.section_by_name[section].is_list:
+            properties[section] = {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {key: {"type": "string"} for key in COVER_KEYS},
+                    "required": COVER_KEYS,
+                },
+            }
+        else:
+            properties[section] = {
+                "type": "object",
+                "properties": {field: {"type": "string"} for field in fields},
+                "required": list(fields),
+            }
+    return {"type": "object", "properties": properties, "required": list(section_fields)}
+
+
+class _TolerantParser:
+    """Single-pass recursive-descent parser for almost-JSON model output.
+
+    Accepts code fences and prose around the object, trailing or missing
+    commas, single-quoted strings and bare keys, Python literals, raw control
+    characters inside strings and truncated input. When the input ends early
+    it closes every open container and records the top-level key that was
+    being written in `incomplete`.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.pos = 0
+        self.depth_keys = []
+        self.incomplete = set()
+
+    def _eof(self):
+        if self.depth_keys and self.depth_keys[0] is not None:
+            self.incomplete.add(self.depth_keys[0])
+        return self.pos >= len(self.text)
+
+    def _skip(self):
+        text = self.text
+        while self.pos < len(text):
+            char = text[self.pos]
+            if char in _WHITESPACE:
+                self.pos += 1
+            elif text.startswith("//", self.pos):
+                end = text.find("\n", self.pos)
+                self.pos = len(text) if end < 0 else end
+            else:
+                break
+
+    def parse(self):
+        starts = [idx for idx in (self.text.find("{"), self.text.find("[")) if idx >= 0]
+        if not starts:
+            raise json.JSONDecodeError("No JSON object found in response", self.text, 0)
+        self.pos = min(starts)
+        return self._value()
+
+    def _value(self):
+        self._skip()
+        if self.pos >= len(self.text):
+            self._eof()
+            return None
+        char = self.text[self.pos]
+        if char == "{":
+            return self._object()
+        if char == "[":
+            return self._array()
+        if char in "\"'":
+            return self._string()
+        return self._literal()
+
+    def _object(self):
+        self.pos += 1
+        result = {}
+        self.depth_keys.append(None)
+        while True:
+            self._skip()
+            if self.pos >= len(self.text):
+                self._eof()
+                break
+            char = self.text[self.pos]
+            if char == "}":
+                self.pos += 1
+                break
+            if char in ",;":
+                self.pos += 1
+                continue
+            key = self._string() if char in "\"'" else self._bare_key()
+            if key == "" and self.pos < len(self.text) and self.text[self.pos] not in ":\"'":
+                self.pos += 1  # skip a stray character we cannot use
+                continue
+            self.depth_keys[-1] = key
+            self._skip()
+            if self.pos < len(self.text) and self.text[self.pos] in ":=":
+                self.pos += 1
+            result[key] = self._value()
+        self.depth_keys.pop()
+        return result
+
+    def _array(self):
+        self.pos += 1
+        result = []
+        while True:
+            self._skip()
+            if self.pos >= len(self.text):
+                self._eof()
+                break
+            char = self.text[self.pos]
+            if char == "]":
+                self.pos += 1
+                break
+            if char == ",":
+                self.pos += 1
+                continue
+            start = self.pos
+            result.append(self._value())
+            if self.pos == start:
+                self.pos += 1
+        return result
+
+    def _string(self):
+        text = self.text
+        quote = text[self.pos]
+        self.pos += 1
+        chunks = []
+        start = self.pos
+        while self.pos < len(text):
+            char = text[self.pos]
+            if char == quote:
+                chunks.append(text[start:self.pos])
+                self.pos += 1
+                return "".join(chunks)
+            if char == "\\" and self.pos + 1 < len(text):
+                chunks.append(text[start:self.pos])
+                escape = text[self.pos + 1]
+                if escape == "u" and self.pos + 6 <= len(text):
+                    try:
+                        chunks.append(chr(int(text[self.pos + 2:self.pos + 6], 16)))
+                        self.pos += 6
+                        start = self.pos
+                        continue
+                    except ValueError:
+                        pass
+                chunks.append(_ESCAPES.get(escape, escape))
+                self.pos += 2
+                start = self.pos
+                continue
+            self.pos += 1
+        chunks.append(text[start:])
+        self._eof()
+        return "".join(chunks)
+
+    def _bare_key(self):
+        start = self.pos
+        while self.pos < len(self.text) and self.text[self.pos] not in ":=,}" + _WHITESPACE:
+            self.pos += 1
+        return self.text[start:self.pos]
+
+    def _literal(self):
+        start = self.pos
+        while self.pos < len(self.text) and self.text[self.pos] not in ",]}" + _WHITESPACE:
+            self.pos += 1
+        token = self.text[start:self.pos]
+        if self.pos >= len(self.text):
+            self._eof()
+        if token in _LITERALS:
+            return _LITERALS[token]
+        try:
+            return json.loads(token)
+        except ValueError:
+            return token
+
+
+def decode_response(text):
+    """Decode a model response into (data, incomplete_sections).
+
+    Well-formed JSON takes the C decoder fast path; anything else goes
+    through the tolerant repairing parser. `incomplete_sections` lists the
+    top-level keys cut off by a truncated response.
+    """
+    stripped = text.strip()
+    if stripped.startswith("```"):
+        stripped = stripped.split("\n", 1)[1] if "\n" in stripped else ""
+        if stripped.rstrip().endswith("```"):
+            stripped = stripped.rstrip()[:-3]
+    try:
+        return json.loads(stripped), []
+    except ValueError:
+        pass
+    parser = _TolerantParser(stripped)
+    data = parser.parse()
+    return data, sorted(parser.incomplete)
+
+
+def _as_text(value):
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, (list, tuple)):
+        return ", ".join(_as_text(item) for item in value)
+    return str(value)
+
+
+def validate_extraction(data, section_fields, incomplete_sections=()):
+    """Check decoded data against the four-section layout.
+
+    Returns (clean, invalid_sections): `clean` holds every requested section
+    with string-typed values (missing fields become ""), and
+    `invalid_sections` lists sections that were absent, had the wrong shape
+    or were truncated, and so are worth re-asking for.
+    """
+    if not isinstance(data, dict):
+        data = {}
+    clean = {}
+    invalid = []
+    for section, fields in section_fields.items():
+        value = data.get(section)
+        if SCHEMA.section_by_name[section].is_list:
+            if isinstance(value, dict):
+                value = [value]
+            if not isinstance(value, list) or not all(isinstance(item, dict) for item in value):
+                invalid.append(section)
+                value = [item for item in value if isinstance(item, dict)] if isinstance(value, list) else []
+            clean[section] = [{key: _as_text(item.get(key, "")) for key in COVER_KEYS} for item in value]
+        else:
+            if not isinstance(value, dict):
+                invalid.append(section)
+                value = {}
+            clean[section] = {field: _as_text(value.get(field, "")) for field in fields}
+        if section in incomplete_sections and section not in invalid:
+            invalid.append(section)
+    return clean, invalid
@@ -0,0 +1,185 @@
+"""Headless entry points to the extractor: a command line and an HTTP service.
+
+    python service.py extract form.pdf [more.pdf ...] [--format json|xlsx] [--output PATH]
+    python service.py serve [--host 0.0.0.0] [--port 8080]
+
+The HTTP service accepts a PDF as the body of POST /extract and answers with
+the flatten_json record (?format=json, the default) or the save_to_excel
+workbook (?format=xlsx). GET /healthz reports liveness and GET /metrics
+serves the Prometheus metrics. Neither path imports Streamlit.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from extractor import (
+    BATCH_MAX_WORKERS, describe_extraction_error, extract_document, process_documents_batch,
+    save_batch_to_excel, save_to_excel, warm_up
+)
+from telemetry import METRICS, configure_logging
+
+logger = logging.getLogger(__name__)
+
+# Concurrent extractions the HTTP service runs; further requests wait for a slot
+SERVICE_WORKERS = int(os.getenv('SERVICE_WORKERS', '8'))
+# Seconds a request waits for its extraction before answering 504
+SERVICE_REQUEST_TIMEOUT = float(os.getenv('SERVICE_REQUEST_TIMEOUT', '300'))
+# Seconds a client may take to send its request
+SERVICE_READ_TIMEOUT = float(os.getenv('SERVICE_READ_TIMEOUT', '60'))
+SERVICE_MAX_UPLOAD_MB = float(os.getenv('SERVICE_MAX_UPLOAD_MB', '20'))
+
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+class ExtractionHandler(BaseHTTPRequestHandler):
+    server_version = "InsuranceExtractor/1.0"
+    timeout = SERVICE_READ_TIMEOUT
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/healthz":
+            self._send_json(200, {"status": "ok"})
+        elif path == "/metrics":
+            self._send(200, METRICS.render().encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8")
+        else:
+            self._send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/extract":
+            self._send_json(404, {"error": "Not found"})
+            return
+        fmt = parse_qs(url.query).get("format", ["json"])[0]
+        if fmt not in ("json", "xlsx"):
+            self._send_json(400, {"error": f"Unsupported format: {fmt!r} (expected json or xlsx)"})
+            return
+
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > SERVICE_MAX_UPLOAD_MB * 1024 * 1024:
+            self._send_json(413, {"error": f"PDF larger than {SERVICE_MAX_UPLOAD_MB:g} MB"})
+            return
+        pdf_bytes = self.rfile.read(length)
+        if not pdf_bytes.startswith(b"%PDF"):
+            self._send_json(400, {"error": "Request body is not a PDF document"})
+            return
+
+        # A timed-out extraction keeps running and lands in the extraction
+        # cache, so repeating the request picks up its result
+        future = self.server.executor.submit(extract_document, pdf_bytes)
+        try:
+            record = future.result(timeout=self.server.request_timeout)
+        except TimeoutError:
+            self._send_json(504, {"error": f"Extraction did not finish within {self.server.request_timeout:g}s"})
+            return
+        except ValueError as e:
+            self._send_json(422, {"error": describe_extraction_error(e)})
+            return
+        except Exception as e:
+            logger.exception("Extraction failed")
+            self._send_json(502, {"error": describe_extraction_error(e)})
+            return
+
+        if fmt == "xlsx":
+            self._send(200, save_to_excel(record).getvalue(), XLSX_MIME)
+        else:
+            self._send_json(200, record)
+
+    def _send_json(self, status, payload):
+        self._send(status, json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json")
+
+    def _send(self, status, body, content_type):
+        path = urlparse(self.path).path if status != 404 else "other"
+        METRICS.inc("http_requests_total", help="HTTP requests served", path=path, status=status)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.info("%s - %s", self.address_string(), format % args)
+
+
+def make_server(host="127.0.0.1", port=8080, workers=SERVICE_WORKERS, request_timeout=SERVICE_REQUEST_TIMEOUT):
+    """Threaded HTTP server sharing one extraction pool and one warm model client"""
+    warm_up()
+    server = ThreadingHTTPServer((host, port), ExtractionHandler)
+    server.daemon_threads = True
+    server.executor = ThreadPoolExecutor(max_workers=max(1, int(workers)), thread_name_prefix="extract")
+    server.request_timeout = request_timeout
+    return server
+
+
+def serve(args):
+    server = make_server(args.host, args.port, args.workers, args.timeout)
+    logger.info("Serving on http://%s:%d", *server.server_address[:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def extract(args):
+    documents = []
+    for path in args.files:
+        with open(path, "rb") as f:
+            documents.append((os.path.basename(path), f.read()))
+
+    results = process_documents_batch(documents, max_workers=args.workers)
+    for file_name, _, error in results:
+        if error:
+            print(f"{file_name}: {error}", file=sys.stderr)
+    succeeded = [(file_name, record) for file_name, record, error in results if record]
+
+    if args.format == "xlsx":
+        if not args.output:
+            sys.exit("--output is required for xlsx")
+        if len(documents) == 1 and succeeded:
+            with open(args.output, "wb") as f:
+                f.write(save_to_excel(succeeded[0][1]).getvalue())
+        elif succeeded:
+            save_batch_to_excel(succeeded, args.output)
+    else:
+        payload = succeeded[0][1] if len(documents) == 1 and succeeded else dict(succeeded)
+        text = json.dumps(payload, ensure_ascii=False, indent=2)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                f.write(text + "\n")
+        else:
+            print(text)
+    return 0 if len(succeeded) == len(documents) else 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless insurance form extraction")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    extract_parser = commands.add_parser("extract", help="Extract one or more PDFs")
+    extract_parser.add_argument("files", nargs="+")
+    extract_parser.add_argument("--format", choices=("json", "xlsx"), default="json")
+    extract_parser.add_argument("--output", help="Write here instead of stdout (required for xlsx)")
+    extract_parser.add_argument("--workers", type=int, default=BATCH_MAX_WORKERS)
+    extract_parser.set_defaults(handler=extract)
+
+    serve_parser = commands.add_parser("serve", help="Run the HTTP service")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8080)
+    serve_parser.add_argument("--workers", type=int, default=SERVICE_WORKERS)
+    serve_parser.add_argument("--timeout", type=float, default=SERVICE_REQUEST_TIMEOUT)
+    serve_parser.set_defaults(handler=serve)
+
+    args = parser.parse_args(argv)
+    configure_logging()
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+_LITERAL_END = set(",}] \t\r\n")
+
+
+class StreamingFieldParser:
+    """Incremental JSON scanner that reports scalar values as soon as they complete.
+
+    Feed it chunks of a streamed model response; `feed` returns a list of
+    (path, value) pairs for every string, number or literal that finished in
+    that chunk, where `path` is the tuple of object keys / list indices
+    leading to the value, e.g. ("Vehicle Information", "Chassis_No") or
+    ("Insurance Coverage", 0, "Amount"). Anything before the first '{' (such
+    as a ```json fence) is ignored. It only reports values; the complete
+    response is still decoded by the regular JSON parser at the end.
+    """
+
+    def __init__(self):
+        self._stack = []        # [container_type, key_or_index] frames
+        self._started = False
+        self._in_string = False
+        self._escape = False
+        self._unicode = None    # pending \\uXXXX digits
+        self._buffer = []
+        self._literal = None
+        self._expect_key = False
+
+    def _path(self):
+        return tuple(frame[1] for frame in self._stack)
+
+    def _emit_value(self, value, events):
+        if self._stack:
+            events.append((self._path(), value))
+
+    def _open(self, kind):
+        if kind == "object":
+            self._stack.append(["object", None])
+            self._expect_key = True
+        else:
+            self._stack.append(["array", 0])
+            self._expect_key = False
+
+    def _close(self):
+        if self._stack:
+            self._stack.pop()
+        self._expect_key = False
+
+    def _finish_literal(self, events):
+        text = "".join(self._literal)
+        self._literal = None
+        if text in ("true", "false", "null"):
+            value = {"true": True, "false": False, "null": None}[text]
+        else:
+            try:
+                value = float(text) if any(c in text for c in ".eE") else int(text)
+            except ValueError:
+                return
+        self._emit_value(value, events)
+
+    def _finish_string(self, events):
+        text = "".join(self._buffer)
+        self._buffer = []
+        frame = self._stack[-1] if self._stack else None
+        if frame is not None and frame[0] == "object" and self._expect_key:
+            frame[1] = text
+            self._expect_key = False
+        else:
+            self._emit_value(text, events)
+
+    def feed(self, chunk):
+        events = []
+        for char in chunk:
+            if not self._started:
+                if char == "{":
+                    self._started = True
+                    self._open("object")
+                continue
+            if self._in_string:
+                if self._unicode is not None:
+                    self._unicode += char
+                    if len(self._unicode) == 4:
+                        try:
+                            self._buffer.append(chr(int(self._unicode, 16)))
+                        except ValueError:
+                            pass
+                        self._unicode = None
+                elif self._escape:
+                    self._escape = False
+                    if char == "u":
+                        self._unicode = ""
+                    else:
+                        self._buffer.append({"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f"}.get(char, char))
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    self._finish_string(events)
+                else:
+                    self._buffer.append(char)
+                continue
+            if self._literal is not None:
+                if char not in _LITERAL_END:
+                    self._literal.append(char)
+                    continue
+                self._finish_literal(events)
+            if char == '"':
+                self._in_string = True
+            elif char == "{":
+                self._open("object")
+            elif char == "[":
+                self._open("array")
+            elif char in "}]":
+                self._close()
+            elif char == ",":
+                frame = self._stack[-1] if self._stack else None
+                if frame is not None and frame[0] == "array":
+                    frame[1] += 1
+                elif frame is not None:
+                    self._expect_key = True
+            elif char not in ": \t\r\n":
+                self._literal = [char]
+        return events
@@ -0,0 +1,294 @@
+"""Per-stage spans, counters and cost tracking for document extraction.
+
+Spans and document traces feed an in-process Metrics registry that renders
+the Prometheus text format (served by service.py at /metrics, or by
+serve_metrics for the Streamlit app) and backs the in-app dashboard. Every
+span is also logged as a structured event; with LOG_FORMAT=json the log
+lines are single JSON objects.
+"""
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger("telemetry")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# USD per million tokens, used to turn usage metadata into spend
+PRICE_INPUT_PER_MTOK = float(os.getenv("GEMINI_PRICE_INPUT_PER_MTOK", "0.075"))
+PRICE_OUTPUT_PER_MTOK = float(os.getenv("GEMINI_PRICE_OUTPUT_PER_MTOK", "0.30"))
+
+_document_id = contextvars.ContextVar("document_id", default=None)
+
+
+def _label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class Metrics:
+    """Thread-safe counters and histograms with a Prometheus text renderer.
+
+    Histograms also keep the last `window` observations per label set, so
+    the dashboard can show exact recent percentiles. Collectors registered
+    with add_collector report values owned by other components (cache,
+    scheduler, upload registry) at render time.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, window=1000):
+        self.buckets = tuple(buckets)
+        self.window = window
+        self._lock = threading.Lock()
+        self._help = {}
+        self._counters = defaultdict(float)
+        self._histograms = {}
+        self._recent = defaultdict(lambda: deque(maxlen=self.window))
+        self._daily_spend = defaultdict(float)
+        self._collectors = []
+
+    def inc(self, name, value=1, help="", **labels):
+        with self._lock:
+            self._help.setdefault(name, ("counter", help))
+            self._counters[(name, _label_key(labels))] += value
+
+    def observe(self, name, value, help="", **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._help.setdefault(name, ("histogram", help))
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+            idx = bisect_left(self.buckets, value)
+            if idx < len(self.buckets):
+                histogram[0][idx] += 1
+            histogram[1] += value
+            histogram[2] += 1
+            self._recent[key].append(value)
+
+    def add_collector(self, collect):
+        """Register `collect()`, returning (name, kind, help, labels, value) tuples."""
+        with self._lock:
+            self._collectors.append(collect)
+
+    def percentiles(self, name, quantiles=(0.5, 0.95), **labels):
+        """Nearest-rank percentiles over the recent window, or None with no data."""
+        with self._lock:
+            values = sorted(self._recent.get((name, _label_key(labels)), ()))
+        if not values:
+            return {q: None for q in quantiles}
+        return {q: values[min(len(values) - 1, int(q * len(values)))] for q in quantiles}
+
+    def label_values(self, name, label):
+        """Values seen for `label` across a histogram's series."""
+        with self._lock:
+            keys = [key for metric, key in self._histograms if metric == name]
+        return sorted({value for key in keys for name_, value in key if name_ == label})
+
+    def count(self, name, **labels):
+        with self._lock:
+            if (name, _label_key(labels)) in self._histograms:
+                return self._histograms[(name, _label_key(labels))][2]
+            return self._counters.get((name, _label_key(labels)), 0)
+
+    def record_usage(self, usage, model):
+        """Count the tokens of one response and add its cost to today's spend."""
+        prompt = getattr(usage, "prompt_token_count", 0) or 0
+        output = getattr(usage, "candidates_token_count", 0) or 0
+        cost = (prompt * PRICE_INPUT_PER_MTOK + output * PRICE_OUTPUT_PER_MTOK) / 1_000_000
+        self.inc("gemini_tokens_total", prompt, "Tokens billed by Gemini", model=model, kind="prompt")
+        self.inc("gemini_tokens_total", output, "Tokens billed by Gemini", model=model, kind="output")
+        self.inc("gemini_cost_usd_total", cost, "Estimated Gemini spend in USD", model=model)
+        with self._lock:
+            self._daily_spend[datetime.now(timezone.utc).date().isoformat()] += cost
+        return prompt, output, cost
+
+    def daily_spend(self, days=7):
+        """[(ISO date, USD)] for the last `days` UTC days, oldest first."""
+        today = datetime.now(timezone.utc).date()
+        dates = [(today - timedelta(days=offset)).isoformat() for offset in range(days - 1, -1, -1)]
+        with self._lock:
+            return [(date, self._daily_spend.get(date, 0.0)) for date in dates]
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: (list(h[0]), h[1], h[2]) for key, h in self._histograms.items()}
+            helps = dict(self._help)
+            collectors = list(self._collectors)
+
+        lines = []
+        families = defaultdict(list)
+        for (name, key), value in counters.items():
+            families[name].append(f"{name}{_format_labels(key)} {_format_value(value)}")
+        for (name, key), (counts, total, observations) in histograms.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                families[name].append(f"{name}_bucket{_format_labels(key, [('le', f'{bound:g}')])} {cumulative}")
+            families[name].append(f"{name}_bucket{_format_labels(key, [('le', '+Inf')])} {observations}")
+            families[name].append(f"{name}_sum{_format_labels(key)} {_format_value(total)}")
+            families[name].append(f"{name}_count{_format_labels(key)} {observations}")
+        for collect in collectors:
+            try:
+                samples = list(collect())
+            except Exception:
+                logger.exception("Metrics collector failed")
+                continue
+            for name, kind, help, labels, value in samples:
+                helps.setdefault(name, (kind, help))
+                families[name].append(f"{name}{_format_labels(_label_key(labels))} {_format_value(value)}")
+
+        for name in sorted(families):
+            kind, help = helps.get(name, ("untyped", ""))
+            if help:
+                lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(families[name])
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+
+
+def emit(event, **fields):
+    """Log a structured event, tagged with the current document."""
+    document_id = _document_id.get()
+    if document_id:
+        fields.setdefault("document", document_id)
+    logger.info("%s %s", event, " ".join(f"{key}={value}" for key, value in fields.items()),
+                extra={"telemetry": {"event": event, **fields}})
+
+
+@contextmanager
+def span(stage, **fields):
+    """Time a pipeline stage; the yielded dict's entries are added to its log event."""
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield fields
+    except Exception as e:
+        status = "error"
+        fields["error"] = type(e).__name__
+        METRICS.inc("extraction_stage_errors_total", help="Pipeline stage failures", stage=stage, error=type(e).__name__)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        METRICS.observe("extraction_stage_seconds", elapsed, help="Time spent per pipeline stage", stage=stage)
+        emit("span", stage=stage, status=status, duration_ms=round(elapsed * 1000, 2), **fields)
+
+
+@contextmanager
+def document_trace(pdf_bytes):
+    """Tag spans with the document's content hash and time the whole extraction.
+
+    Set `trace["outcome"]` inside the block (e.g. "cached", "text_layer",
+    "gemini"); failures are recorded as "error".
+    """
+    token = _document_id.set(hashlib.sha256(pdf_bytes).hexdigest()[:12])
+    trace = {"outcome": "unknown", "bytes": len(pdf_bytes)}
+    started = time.perf_counter()
+    try:
+        yield trace
+    except Exception:
+        trace["outcome"] = "error"
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        METRICS.observe("extraction_document_seconds", elapsed, help="End-to-end extraction time per document")
+        METRICS.inc("extraction_documents_total", help="Documents extracted, by outcome", outcome=trace["outcome"])
+        emit("document", duration_ms=round(elapsed * 1000, 2), **trace)
+        _document_id.reset(token)
+
+
+def in_current_context(fn):
+    """Wrap `fn` to run in a copy of the caller's context (for worker threads)."""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.copy().run(fn, *args, **kwargs)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per log line, with any telemetry fields inlined."""
+
+    def format(self, record):
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        payload.update(getattr(record, "telemetry", {}))
+        if record.exc_info:
+            payload["exception"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+_logging_configured = False
+
+
+def configure_logging(level=logging.INFO):
+    """Install a root handler once; JSON lines when LOG_FORMAT=json."""
+    global _logging_configured
+    if _logging_configured:
+        return
+    _logging_configured = True
+    handler = logging.StreamHandler()
+    if os.getenv("LOG_FORMAT", "text").lower() == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(level)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = METRICS.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_metrics_server = None
+_metrics_server_lock = threading.Lock()
+
+
+def serve_metrics(port, host="0.0.0.0"):
+    """Serve /metrics on a daemon thread; later calls reuse the running server."""
+    global _metrics_server
+    with _metrics_server_lock:
+        if _metrics_server is None:
+            _metrics_server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            _metrics_server.daemon_threads = True
+            threading.Thread(target=_metrics_server.serve_forever, name="metrics", daemon=True).start()
+        return _metrics_server
@@ -0,0 +1,140 @@
+import re
+
+import pymupdf
+
+from field_schema import COVERAGE_SECTION, SCHEMA
+
+# Pages averaging fewer characters than this are treated as a scan
+MIN_CHARS_PER_PAGE = 200
+
+DATE_FIELDS = {f.name for f in SCHEMA.fields_of_type("date")}
+AMOUNT_FIELDS = {f.name for f in SCHEMA.fields_of_type("amount")}
+
+# A label starts a line or a new column (two or more spaces / a pipe) and is
+# separated from its value by a colon or dash, a tab or a gap of two or more
+# spaces, so text continuing the label is never read as the value; the value
+# runs to the end of the line or the next column gap, or sits on the next line
+# when the label ends with a colon
+_VALUE_PATTERN = (
+    r"(?:^|\s{{2,}}|\|)[ \t]*(?:{label})(?:[ \t]*:[ \t]*\n|[ \t]*[:\-]|[ \t]*\t| {{2,}})[ \t]*"
+    r"(?P<value>\S[^\n|]*?)(?=\s{{2,}}|\||$)"
+)
+
+# Label-anchored rules compiled from the printed labels declared on each field
+_COMPILED_RULES = {
+    section.name: {
+        field.name: [re.compile(_VALUE_PATTERN.format(label=label), re.IGNORECASE | re.MULTILINE) for label in field.labels]
+        for field in SCHEMA.fields_by_section[section.name] if field.labels
+    }
+    for section in SCHEMA.sections if not section.is_list
+}
+
+# Any printed label or heading, for telling a blank field's neighbour apart from its value
+_ANY_LABEL = "|".join(f"(?:{label})" for field in SCHEMA.fields for label in field.labels)
+_STARTS_WITH_LABEL = re.compile(rf"(?:{_ANY_LABEL}|Additional\s+Covers?)(?![A-Za-z])", re.IGNORECASE)
+_CONTAINS_LABEL = re.compile(rf"(?:{_ANY_LABEL})[ \t]*:", re.IGNORECASE)
+
+_COVERS_HEADER = re.compile(r"^\s*Additional\s+Covers?\b.*$", re.IGNORECASE | re.MULTILINE)
+_TICKED_COVER = re.compile(r"^\s*(?:[☑☒✓✔]|\[\s*[xX✓✔]\s*\])\s*(?P<cover>.+?)\s*$", re.MULTILINE)
+_UNTICKED_COVER = re.compile(r"^\s*(?:☐|\[\s*\])\s*\S", re.MULTILINE)
+_AMOUNT = re.compile(r"\d[\d,]*(?:\.\d+)?")
+_COVER_AMOUNT = re.compile(r"(?:Rs\.?|LKR)?\s*(?P<amount>\d[\d,]*(?:\.\d+)?)\s*$")
+
+
+def extract_text_layer(pdf_bytes):
+    """Return (text, page_count) from the PDF's embedded text layer."""
+    with pymupdf.open(stream=pdf_bytes, filetype="pdf") as doc:
+        return "\n".join(page.get_text("text") for page in doc), doc.page_count
+
+
+def is_scanned(text, page_count):
+    """True when the text layer is too thin to extract from."""
+    return len(text.strip()) < MIN_CHARS_PER_PAGE * max(page_count, 1)
+
+
+def _valid(field, value):
+    if not value:
+        return False
+    if field in DATE_FIELDS or field in AMOUNT_FIELDS:
+        return any(c.isdigit() for c in value)
+    return True
+
+
+def _match_field(field, rules, text):
+    for rule in rules:
+        for match in rule.finditer(text):
+            value = match.group("value")
+            # A blank field followed by another label must not take that line as its value
+            if _STARTS_WITH_LABEL.match(value) or _CONTAINS_LABEL.search(value):
+                continue
+            value = value.strip(" .:_")
+            if field in AMOUNT_FIELDS:
+                # Drop currency prefixes such as "Rs." that would corrupt the number
+                amount = _AMOUNT.search(value)
+                value = amount.group(0) if amount else ""
+            if _valid(field, value):
+                return value
+    return None
+
+
+def _match_covers(text):
+    header = _COVERS_HEADER.search(text)
+    if header is None:
+        return None
+    covers = []
+    for match in _TICKED_COVER.finditer(text, header.end()):
+        cover = match.group("cover")
+        amount = _COVER_AMOUNT.search(cover)
+        if amount:
+            cover = cover[:amount.start()].rstrip(" -:")
+        covers.append({
+            "Cover Type": cover,
+            "Amount": amount.group("amount") if amount else "",
+            "Additional Info": "",
+        })
+    # No ticks at all only means "no additional covers" when the unticked
+    # boxes were read; otherwise the block is left to Gemini
+    if not covers and _UNTICKED_COVER.search(text, header.end()) is None:
+        return None
+    return covers
+
+
+def prefill_from_text(text):
+    """Apply the label rules to text-layer content.
+
+    Returns (extracted, missing): `extracted` uses the same section layout as
+    the Gemini response, and `missing` maps each section to the fields the
+    rules could not resolve ('Insurance Coverage' maps to [] when the covers
+    block was not found, or has no ticked or unticked boxes).
+    """
+    extracted = {}
+    missing = {}
+    for section, rules in _COMPILED_RULES.items():
+        extracted[section] = {}
+        for field, field_rules in rules.items():
+            value = _match_field(field, field_rules, text)
+            if value is None:
+                missing.setdefault(section, []).append(field)
+            else:
+                extracted[section][field] = value
+    covers = _match_covers(text)
+    if covers is None:
+        missing[COVERAGE_SECTION] = []
+    else:
+        extracted[COVERAGE_SECTION] = covers
+    return extracted, missing
+
+
+def prefill_document(pdf_bytes):
+    """Run the local fast path on a PDF.
+
+    Returns (extracted, missing), or (None, None) when the document is a scan
+    or cannot be opened, in which case the full Gemini extraction should run.
+    """
+    try:
+        text, page_count = extract_text_layer(pdf_bytes)
+    except Exception:
+        return None, None
+    if is_scanned(text, page_count):
+        return None, None
+    return prefill_from_text(text)
@@ -0,0 +1,87 @@
+import hashlib
+import threading
+import time
+from datetime import datetime, timezone
+from io import BytesIO
+
+# Gemini keeps uploaded files for 48 hours; stop reusing them a little earlier
+DEFAULT_TTL_SECONDS = 46 * 3600
+EXPIRY_MARGIN_SECONDS = 15 * 60
+
+
+class UploadRegistry:
+    """Maps document content hashes to already-uploaded remote file handles.
+
+    Uploads go straight from memory, and identical bytes (retries, repeat
+    documents, other sessions) reuse the existing handle until it nears its
+    expiry. Concurrent requests for the same bytes share a single upload.
+    """
+
+    def __init__(self, upload_fn, ttl_seconds=DEFAULT_TTL_SECONDS, clock=time.time):
+        self.upload_fn = upload_fn
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.uploads = 0
+        self.reuses = 0
+        self._entries = {}
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    def _expires_at(self, handle):
+        expiration = getattr(handle, "expiration_time", None)
+        if isinstance(expiration, datetime):
+            if expiration.tzinfo is None:
+                expiration = expiration.replace(tzinfo=timezone.utc)
+            return expiration.timestamp() - EXPIRY_MARGIN_SECONDS
+        return self.clock() + self.ttl_seconds
+
+    def get_or_upload(self, pdf_bytes, mime_type="application/pdf"):
+        """Return a remote handle for `pdf_bytes`, uploading only if none is live."""
+        key = hashlib.sha256(pdf_bytes).hexdigest()
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry[1] > self.clock():
+                    self.reuses += 1
+                    return entry[0]
+            handle = self.upload_fn(path=BytesIO(pdf_bytes), mime_type=mime_type)
+            with self._lock:
+                self._entries[key] = (handle, self._expires_at(handle))
+                self.uploads += 1
+                self._prune()
+            return handle
+
+    def invalidate(self, pdf_bytes):
+        """Forget the handle for `pdf_bytes`, e.g. after the server rejected it."""
+        key = hashlib.sha256(pdf_bytes).hexdigest()
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def _prune(self):
+        now = self.clock()
+        for key in [key for key, (_, expires_at) in self._entries.items() if expires_at <= now]:
+            del self._entries[key]
+            self._key_locks.pop(key, None)
+
+
+_default_registry = None
+_default_registry_lock = threading.Lock()
+
+
+def get_default_registry():
+    """Process-wide registry backed by genai.upload_file."""
+    global _default_registry
+    with _default_registry_lock:
+        if _default_registry is None:
+            import google.generativeai as genai
+
+            _default_registry = UploadRegistry(lambda **kwargs: genai.upload_file(**kwargs))
+        return _default_registry
+
+
+def is_stale_file_error(error):
+    """True when Gemini rejected a request because the uploaded file is gone."""
+    text = str(error).lower()
+    return "file" in text and any(hint in text for hint in ("not found", "expired", "permission", "404", "403"))